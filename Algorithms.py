@@ -1,6 +1,39 @@
 from DoublyLinkedList import DoublyLinkedList as DDList
+from bisect import bisect_right
 from collections import namedtuple
-from operator import attrgetter
+import heapq
+import json
+import os
+import sys
+import time
+
+
+MINUTES_PER_DAY = 24 * 60
+
+# What each search engine did: the stations it settled, the edges it looked along from them and the entries it added
+# to its queue.
+SearchCounts = namedtuple('SearchCounts', ['settled', 'relaxed', 'pushes'])
+
+# The result of one search from 'start' to every station - the arrival time, previous station and line taken for each
+# station ID, as dense lists, plus what the search did.
+SearchTree = namedtuple('SearchTree', ['start', 'distance', 'previous', 'via_line', 'counts'])
+
+# An edge of the contraction hierarchy. Original edges have a 'line' ID and no 'middle' (-1). Shortcuts skip the
+# 'middle' station and replace the hierarchy edges 'first' (tail to middle) and 'second' (middle to head).
+HierarchyEdge = namedtuple('HierarchyEdge', ['tail', 'head', 'cost', 'middle', 'first', 'second', 'line'])
+
+# The 'interchange' engine's default time, in minutes, to change between lines at a station, and the name it gives
+# the walks between stations in place of a line.
+INTERCHANGE_PENALTY = 3
+WALK = "Walk"
+
+# 'Graph.alternatives' gives up after finding this many routes per alternative asked for, in case nearly every route
+# left is too like one already found.
+ROUTES_PER_ALTERNATIVE = 10
+
+# Contraction hierarchy files - the magic bytes and format version written by 'Graph.save_hierarchy'.
+HIERARCHY_MAGIC = b"LURPCH\0\0"
+HIERARCHY_VERSION = 1
 
 
 class Station:
@@ -19,88 +52,1603 @@ class Station:
         self.neighbours.add_first(station)
 
     def return_neighbours(self):
-        return self.neighbours.traverse_all()
+        # Iterates over the neighbours in place rather than copying them into a new list.
+        return iter(self.neighbours)
 
 
 class Graph:
     """
     Creates a Graph with the provided information (edges and nodes) and contains a function that calculates the shortest
     path between two given stations/nodes.
+
+    The adjacency index is built once when the graph is created, so each call to 'dijkstra' only has to set up the
+    per-query distance and predecessor state.
     """
-    def __init__(self, edges, nodes):
+    # The available search engines and the methods that run them. 'linear' is the original min-scan over every
+    # station and is kept so results can be compared against it. 'matrix' reads the route from the all-pairs matrices.
+    # 'bidirectional' and 'alt' (A* with landmarks) settle fewer stations but pick the same route as 'heap', as does
+    # 'hierarchy', which searches a contraction hierarchy built by 'precompute_hierarchy'. 'interchange' searches
+    # (station, line) states instead, so changing lines takes time and the line of each stop is the one really ridden.
+    engines = {"heap": "_search_heap", "bucket": "_search_bucket", "linear": "_search_linear",
+               "matrix": "_search_matrix", "bidirectional": "_search_bidirectional", "alt": "_search_alt",
+               "hierarchy": "_search_hierarchy", "interchange": "_search_interchange"}
+
+    def __init__(self, edges, nodes, profiles=None):
         # Allows us to correctly read the parsed data from the table and stores each record as tuples in a list.
         self.Edge = namedtuple('Edge', ['line', 'start', 'end', 'weight'])
         self.Node = namedtuple('Node', ['line', 'station'])
         self.edges = [self.Edge(*edge) for edge in edges]
         self.nodes = [self.Node(*node) for node in nodes]
-        # Creates a list of all the station names.
-        self.stations = [n.station for n in self.nodes]
+        # Creates a list of all the unique station names, in the order they first appear in the nodes table.
+        self.stations = list(dict.fromkeys(n.station for n in self.nodes))
+        # Maps each station name to its integer ID (its position in 'self.stations').
+        self.station_ids = {station: index for index, station in enumerate(self.stations)}
+        # The order in which stations are scanned when picking the next closest station. The original linked list was
+        # built with 'add_first', so the last appearance of a station in the nodes table decides which way ties go.
+        last_seen = {n.station: index for index, n in enumerate(self.nodes)}
+        self.scan_order = sorted(range(len(self.stations)), key=lambda i: -last_seen[self.stations[i]])
+        self.scan_rank = [0] * len(self.stations)
+        for rank, station_id in enumerate(self.scan_order):
+            self.scan_rank[station_id] = rank
+        # Adjacency index - for each station ID, a list of (neighbour ID, weight, line) tuples. bi-directional.
+        # The edges are read in reverse so the neighbours come out newest first, like the old 'add_first' lists.
+        self.adjacency = [[] for _ in self.stations]
+        for line, start, end, weight in reversed(self.edges):
+            start_id = self.station_ids[start]
+            end_id = self.station_ids[end]
+            self.adjacency[start_id].append((end_id, weight, line))
+            self.adjacency[end_id].append((start_id, weight, line))
+        # The start and end station IDs of each edge, plus the edges at each station and on each line, so a closure
+        # only has to look at the edges it touches.
+        self.edge_ends = [(self.station_ids[edge.start], self.station_ids[edge.end]) for edge in self.edges]
+        self.station_edges = [[] for _ in self.stations]
+        self.line_edges = {}
+        for index, (start_id, end_id) in enumerate(self.edge_ends):
+            self.station_edges[start_id].append(index)
+            self.station_edges[end_id].append(index)
+            self.line_edges.setdefault(self.edges[index].line, []).append(index)
+        # Closures are kept as masks over the shared adjacency. 'open_adjacency' is what the searches read - it shares
+        # each station's list with 'adjacency' until a closure touches that station.
+        self.closed_stations = set()
+        self.closed_lines = set()
+        self.closed_edges = set()
+        self.open_adjacency = list(self.adjacency)
+        # Creates a list of all the train lines and maps each one to its integer ID.
+        self.lines = list(dict.fromkeys([n.line for n in self.nodes] + [e.line for e in self.edges]))
+        self.line_ids = {line: index for index, line in enumerate(self.lines)}
+        # The bucket queue and the all-pairs matrices need whole numbers, so find a scale that turns every weight into
+        # an integer. If there isn't one, neither can be used with these edges.
+        self.weight_scale = next((scale for scale in (1, 2, 4, 10)
+                                  if all(float(edge.weight * scale).is_integer() for edge in self.edges)), None)
+        # Speed profiles - for each line with a profile, the factor its times are multiplied by at each minute of the
+        # day. 'profiles' maps a line to (from minute, until minute, factor) periods, as read by 'load_speed_profiles'.
+        self.speed_tables = {}
+        for line, periods in (profiles or {}).items():
+            table = [1.0] * MINUTES_PER_DAY
+            for from_minute, until_minute, factor in periods:
+                # A period that ends before it starts runs on past midnight.
+                if until_minute <= from_minute:
+                    until_minute += MINUTES_PER_DAY
+                for minute in range(from_minute, until_minute):
+                    table[minute % MINUTES_PER_DAY] = factor
+            self.speed_tables[line] = table
+        # The day split into periods in which every line's factor stays the same - for each minute, the minute its
+        # period starts and how many minutes are left in it. Without any changes, the whole day is one endless period.
+        factors = [tuple(table[minute] for table in self.speed_tables.values()) for minute in range(MINUTES_PER_DAY)]
+        changes = [minute for minute in range(MINUTES_PER_DAY) if factors[minute] != factors[minute - 1]]
+        self.period_starts = [0] * MINUTES_PER_DAY
+        self.period_left = [float("inf")] * MINUTES_PER_DAY
+        for index, change in enumerate(changes):
+            # Each period runs up to the next change, wrapping round past midnight.
+            end = changes[(index + 1) % len(changes)]
+            for offset in range((end - change) % MINUTES_PER_DAY or MINUTES_PER_DAY):
+                minute = (change + offset) % MINUTES_PER_DAY
+                self.period_starts[minute] = change
+                self.period_left[minute] = ((end - change) % MINUTES_PER_DAY or MINUTES_PER_DAY) - offset
+        # Landmarks and the distances from each of them to every station, filled in by 'precompute_landmarks'.
+        self.landmarks = None
+        self.landmark_distances = None
+        # Contraction hierarchy, filled in by 'precompute_hierarchy' - each station's contraction rank, the hierarchy's
+        # edges and shortcuts, for each station the (neighbour, scaled cost, edge index) of edges leading upwards, and
+        # the ways into each station in the order ties are broken.
+        self.hierarchy_rank = None
+        self.hierarchy_edges = None
+        self.hierarchy_upward = None
+        self.hierarchy_arrivals = None
+        # The (station, line) state graph, filled in by 'precompute_interchanges' - see there for the layout. The
+        # penalty and walking transfers it was built with are kept so it can be rebuilt after a closure.
+        self.interchange_settings = (INTERCHANGE_PENALTY, ())
+        self.state_offsets = None
+        self.state_lines = None
+        self.arc_offsets = None
+        self.ride_ends = None
+        self.arc_targets = None
+        self.arc_costs = None
+        self.arc_lines = None
+        self.step_offsets = None
+        self.step_stations = None
+        self.step_weights = None
+        self.chain_steps = None
+        # All-pairs matrices, filled in by 'precompute_all_pairs'.
+        self.distance_matrix = None
+        self.predecessor_matrix = None
+        self.line_matrix = None
+
+    def dijkstra(self, start, finish, engine="heap", departure=None, stats=None):
+        """
+        Returns the shortest path between two stations, the total time on arriving at each station, the line taken to
+        each station and the total journey time.
 
-    def dijkstra(self, start, finish):
+        If 'departure' (minutes after midnight) is given, each line's times follow its speed profile at the time the
+        train leaves each station. Otherwise the times are used as they are and any of the 'engines' can be chosen.
+        If a 'stats' object ('Profiling.QueryStats') is given, the time spent looking up the stations, searching and
+        tracing the path is added to its phases, and the search's 'SearchCounts' to its counters. Without one, nothing
+        is timed.
+        """
+        if stats is not None:
+            started = time.perf_counter()
         # Check if the starting node is in the data set.
-        assert start in self.stations
-        assert finish in self.stations
-        # Create a list to store all the station nodes (Doubly Linked List 1)
-        station_data = DDList()
-        for station in range(len(self.stations)):
-            current_prev = Station(self.nodes[station].station, self.nodes[station].line)
-            if self.stations[station] == start:
-                current_prev.distance = 0
-            station_data.add_first(current_prev)
-        # Searches through the edges list and updates each station with their relevant neighbours. - bi-directional.
-        for line, start, end, weight in self.edges:
-            station1 = next((x for x in station_data.traverse_all() if x.station_name == start), None)
-            station1.add_neighbour((end, weight, line))
-            station2 = next((x for x in station_data.traverse_all() if x.station_name == end), None)
-            station2.add_neighbour((start, weight, line))
-
-        all_station_data = station_data.traverse_all()
-        # Create a queue and add all the stations to be processed. - Gives back a list containing station objects.
-        queue = station_data.traverse_all()
+        assert start in self.station_ids
+        assert finish in self.station_ids
+        if engine not in self.engines:
+            raise ValueError(engine, " is not a valid engine.")
+        start_id = self.station_ids[start]
+        finish_id = self.station_ids[finish]
+        if stats is not None:
+            searched = time.perf_counter()
+            stats.add_time("lookup", searched - started)
+        if departure is not None:
+            if engine == "interchange":
+                distance, previous, via_line, counts = self._search_interchange(start_id, finish_id, departure)
+            elif engine != "heap":
+                raise ValueError("Only the 'heap' and 'interchange' engines can route from a departure time.")
+            else:
+                distance, previous, via_line, counts = self._search_timed(start_id, finish_id, departure)
+        else:
+            distance, previous, via_line, counts = getattr(self, self.engines[engine])(start_id, finish_id)
+        if stats is None:
+            return self._trace_path(finish_id, distance, previous, via_line)
+        traced = time.perf_counter()
+        stats.add_time("search", traced - searched)
+        for name, amount in counts._asdict().items():
+            stats.count(name, amount)
+        route = self._trace_path(finish_id, distance, previous, via_line)
+        stats.add_time("trace", time.perf_counter() - traced)
+        return route
+
+    def profile_period(self, departure):
+        """
+        Returns the period of the day around 'departure' (minutes after midnight) in which no line's speed factor
+        changes, as the minute it starts and the minutes left in it from 'departure'. A journey that arrives before its
+        period ends is timed the same as one leaving at any other minute of the period, so the route can be shared.
+        """
+        minute = int(departure) % MINUTES_PER_DAY
+        return self.period_starts[minute], self.period_left[minute] - (departure - int(departure))
+
+    def one_to_all(self, start, departure=None, budget=None, stats=None):
+        """
+        Runs a single search from 'start' to every station and returns it as a 'SearchTree' of dense lists indexed by
+        station ID (the position in 'self.stations'). Stations that can't be reached have an infinite time and no
+        previous station. 'route_to' reads the route to any station from the tree, the same one 'dijkstra' returns.
+
+        If 'budget' (minutes) is given, the search stops once every station within it is settled and the stations
+        further away are left unreached. 'departure' and 'stats' work as they do for 'dijkstra'.
+        """
+        if stats is not None:
+            started = time.perf_counter()
+        start_id = self._station_id(start)
+        if departure is not None:
+            distance, previous, via_line, counts = self._search_timed(start_id, None, departure, budget)
+        else:
+            distance, previous, via_line, counts = self._search_heap(start_id, None, budget)
+        if budget is not None:
+            # Clears the stations that were reached but not settled, as their times and routes may not be the best.
+            for station_id, value in enumerate(distance):
+                if budget < value < float("inf"):
+                    distance[station_id] = float("inf")
+                    previous[station_id] = None
+                    via_line[station_id] = None
+        if stats is not None:
+            stats.add_time("search", time.perf_counter() - started)
+            for name, amount in counts._asdict().items():
+                stats.count(name, amount)
+        return SearchTree(start_id, distance, previous, via_line, counts)
+
+    def route_to(self, tree, finish):
+        # Returns the route to 'finish' from a 'one_to_all' search, in the same form as 'dijkstra'.
+        return self._trace_path(self._station_id(finish), tree.distance, tree.previous, tree.via_line)
+
+    def isochrone(self, start, budget, departure=None, stats=None):
+        """
+        Returns every station that can be reached from 'start' within 'budget' minutes, mapped to its journey time and
+        ordered from the closest. The search stops at the budget instead of going on across the whole network.
+        """
+        tree = self.one_to_all(start, departure, budget, stats)
+        reached = [station_id for station_id, value in enumerate(tree.distance) if value != float("inf")]
+        reached.sort(key=lambda station_id: (tree.distance[station_id], self.stations[station_id]))
+        return {self.stations[station_id]: tree.distance[station_id] for station_id in reached}
+
+    def many_to_many(self, sources, targets=None, workers=1):
+        """
+        Returns a NumPy matrix of the journey times from each station in 'sources' (rows) to each station in 'targets'
+        (columns, every station by default), with unreachable stations at infinity. There is one search per source
+        and it stops once every target is settled. 'workers' processes share the sources between them (all CPUs if
+        it's None).
+        """
+        import numpy as np
+        source_ids = [self._station_id(station) for station in sources]
+        target_ids = (list(range(len(self.stations))) if targets is None
+                      else [self._station_id(station) for station in targets])
+        blocks = self._map_sources(_distance_rows, source_ids, workers, target_ids)
+        if not blocks:
+            return np.empty((0, len(target_ids)))
+        return np.concatenate(blocks)
+
+    def alternatives(self, start, finish, k=3, max_overlap=0.8):
+        """
+        Returns up to 'k' routes between two stations, quickest first, each in the same (path, times, lines, total)
+        form as 'dijkstra'. The first is the route 'dijkstra' returns. Each one after it is the next quickest sequence
+        of stations that doesn't visit a station twice (Yen's algorithm) and that shares at most 'max_overlap' of its
+        journey time with every route already returned, so routes that only make a small detour are skipped. Routes
+        are told apart by their stations, so taking another line along the same track isn't an alternative.
+
+        Yen's algorithm finds each route by branching off an earlier one at each of its stations in turn. All those
+        'spur' searches share a single search back from the finish, which gives every station's exact time to the
+        finish. That time is the A* heuristic for the spur searches, and where the quickest way on from the branching
+        station doesn't use anything the spur has to avoid, the spur is read straight off it without searching.
+        """
+        start_id = self._station_id(start)
+        finish_id = self._station_id(finish)
+        if start_id == finish_id:
+            return [self._trace_path(finish_id, {finish_id: 0}, {finish_id: None}, {finish_id: None})]
+        # Open edges are the same both ways, so the search back from the finish gives each station's time to it.
+        tree = self._search_heap(finish_id, None)[:3]
+        if tree[0][start_id] == float("inf"):
+            return []
+        # Routes are kept as their stations and the adjacency entry taken from each station to the next.
+        distance, previous, via_line, _ = self._search_heap(start_id, finish_id)
+        nodes = [finish_id]
+        while previous[nodes[-1]] is not None:
+            nodes.append(previous[nodes[-1]])
+        nodes.reverse()
+        steps = [self._step(station_id, node, via_line[node], distance[station_id], distance[node])
+                 for station_id, node in zip(nodes, nodes[1:])]
+        found = [(nodes, steps)]
+        routes = [(nodes, steps)]
+        seen = {tuple(nodes)}
+        candidates = []
+        while len(routes) < k and len(found) < ROUTES_PER_ALTERNATIVE * k:
+            nodes, steps = found[-1]
+            for index, spur_id in enumerate(nodes[:-1]):
+                # A spur has to leave the route's first 'index' stations behind and can't go on to the same station as
+                # any route found so far that shares them.
+                banned_next = set(other_nodes[index + 1] for other_nodes, _ in found
+                                  if other_nodes[:index + 1] == nodes[:index + 1])
+                spur = self._spur_route(spur_id, finish_id, set(nodes[:index]), banned_next, tree)
+                if spur is None or tuple(nodes[:index] + spur[0]) in seen:
+                    continue
+                seen.add(tuple(nodes[:index] + spur[0]))
+                candidate_steps = steps[:index] + spur[1]
+                total = 0
+                for _, weight, _ in candidate_steps:
+                    total = total + weight + 1
+                heapq.heappush(candidates, (total, len(seen), nodes[:index] + spur[0], candidate_steps))
+            if not candidates:
+                break
+            _, _, nodes, steps = heapq.heappop(candidates)
+            found.append((nodes, steps))
+            if all(self._overlap(nodes, steps, other_nodes) <= max_overlap for other_nodes, _ in routes):
+                routes.append((nodes, steps))
+        results = []
+        for nodes, steps in routes:
+            distance = {nodes[0]: 0}
+            previous = {nodes[0]: None}
+            via_line = {nodes[0]: None}
+            for station_id, (node, weight, line) in zip(nodes, steps):
+                distance[node] = distance[station_id] + weight + 1
+                previous[node] = station_id
+                via_line[node] = line
+            results.append(self._trace_path(finish_id, distance, previous, via_line))
+        return results
+
+    def _step(self, station_id, node, line, nearer, further):
+        # The adjacency entry from 'station_id' to 'node' on 'line' that takes the time between 'nearer' and 'further'.
+        return next(entry for entry in self.open_adjacency[station_id]
+                    if entry[0] == node and entry[2] == line and nearer + entry[1] + 1 == further)
+
+    def _spur_route(self, spur_id, finish_id, banned_nodes, banned_next, tree):
+        """
+        Returns the stations and steps of the quickest route from 'spur_id' to the finish that avoids 'banned_nodes'
+        and doesn't go straight on to any of 'banned_next', or None if there isn't one. 'tree' is the search back from
+        the finish - the time from each station to the finish and the next station and line towards it.
+        """
+        to_finish, towards, towards_line = tree
+        # The quickest way on is already known, so it's taken if nothing on it is banned.
+        nodes = [spur_id]
+        steps = []
+        while nodes[-1] != finish_id:
+            station_id = nodes[-1]
+            node = towards[station_id]
+            step = self._step(station_id, node, towards_line[station_id], to_finish[node], to_finish[station_id])
+            if node in banned_nodes or (station_id == spur_id and node in banned_next):
+                break
+            nodes.append(node)
+            steps.append(step)
+        else:
+            return nodes, steps
+        # Otherwise, an A* search with the time to the finish as the heuristic. It never overestimates, even with
+        # stations banned, as that only makes routes longer.
+        distance = {spur_id: 0}
+        previous = {spur_id: None}
+        settled = set()
+        queue = [(to_finish[spur_id], 0, spur_id)]
+        while queue:
+            _, current_distance, current = heapq.heappop(queue)
+            if current in settled:
+                continue
+            settled.add(current)
+            if current == finish_id:
+                break
+            for step in self.open_adjacency[current]:
+                node, weight, line = step
+                if node in settled or node in banned_nodes or (current == spur_id and node in banned_next):
+                    continue
+                # The '+ 1' takes into account of the time needed to wait at each station.
+                next_path = current_distance + weight + 1
+                if next_path < distance.get(node, float("inf")):
+                    distance[node] = next_path
+                    previous[node] = (current, step)
+                    heapq.heappush(queue, (next_path + to_finish[node], next_path, node))
+        if finish_id not in settled:
+            return None
+        nodes = [finish_id]
+        steps = []
+        while previous[nodes[-1]] is not None:
+            station_id, step = previous[nodes[-1]]
+            nodes.append(station_id)
+            steps.append(step)
+        return nodes[::-1], steps[::-1]
+
+    @staticmethod
+    def _overlap(nodes, steps, other_nodes):
+        # The share of a route's journey time spent between stations that are next to each other on another route too,
+        # whichever line either of them takes.
+        shared = set(zip(other_nodes, other_nodes[1:]))
+        shared.update((node, station_id) for station_id, node in list(shared))
+        total = sum(weight + 1 for _, weight, _ in steps)
+        return sum(weight + 1 for pair, (_, weight, _) in zip(zip(nodes, nodes[1:]), steps) if pair in shared) / total
+
+    def _new_state(self, start_id):
+        # Per-query state, indexed by station ID.
+        distance = [float("inf")] * len(self.stations)
+        previous = [None] * len(self.stations)
+        via_line = [None] * len(self.stations)
+        distance[start_id] = 0
+        return distance, previous, via_line
+
+    def _search_linear(self, start_id, finish_id):
+        distance, previous, via_line = self._new_state(start_id)
+        # Create a queue and add all the stations to be processed.
+        queue = list(self.scan_order)
+        relaxed = 0
         while queue:
             # Grabs the shortest path of the available nodes in the queue. Initially, it'll choose the start.
-            current_smallest = min(queue, key=attrgetter("distance"))
+            current_smallest = min(queue, key=distance.__getitem__)
             queue.remove(current_smallest)
             # If there are no more shortest connected neighbours or it has reached its target, then break.
-            if current_smallest.distance == float("inf") or current_smallest.station_name == finish:
+            if distance[current_smallest] == float("inf") or current_smallest == finish_id:
                 break
             # Check the neighbours of the current node and update their distances/values if a shorter route is found.
-            for neighbours in current_smallest.return_neighbours():
-                node, weight, line = neighbours
-                next_path = current_smallest.distance + weight
-                for station in station_data.traverse_all():
-                    if station.station_name == node and next_path < station.distance:
-                        # The '+ 1' takes into account of the time needed to wait at each station.
-                        station.distance = next_path + 1
-                        station.previous = current_smallest.station_name
-                        station.via_line = line
-        # Creates Doubly Linked List containers for shortest path, sum of the time after arriving at each station and
-        # the train line at each station.
-        shortest_path = DDList()
-        stepped_dist = DDList()
-        stepped_line = DDList()
-
-        # Sets the initial value to trace back as the final station.
-        current_prev = finish
-        # Identifies the initial previous value of the final station.
-        temp_value = next((x for x in all_station_data if x.station_name == current_prev), None)
-        current_prev = temp_value.previous
-        # Adds the first sets of initial values.
-        shortest_path.add_last(finish)
-        finish_ = next((x for x in all_station_data if x.station_name == finish), None)
-        stepped_dist.add_last(finish_.distance)
-        stepped_line.add_last(finish_.via_line)
-        # Traverses backwards from the target node to locate and store the shortest path.
+            relaxed += len(self.open_adjacency[current_smallest])
+            for node, weight, line in self.open_adjacency[current_smallest]:
+                next_path = distance[current_smallest] + weight
+                if next_path < distance[node]:
+                    # The '+ 1' takes into account of the time needed to wait at each station.
+                    distance[node] = next_path + 1
+                    previous[node] = current_smallest
+                    via_line[node] = line
+        return distance, previous, via_line, SearchCounts(len(self.scan_order) - len(queue), relaxed, 0)
+
+    def _search_heap(self, start_id, finish_id, budget=None):
+        distance, previous, via_line = self._new_state(start_id)
+        settled = [False] * len(self.stations)
+        # Binary heap of (distance, scan rank, station ID). The scan rank breaks ties the same way as the 'linear'
+        # engine. Entries made stale by a shorter route are skipped when popped instead of being removed from the heap.
+        scan_rank = self.scan_rank
+        # Stations further than the budget are never settled, so the search stops at the first one popped.
+        limit = float("inf") if budget is None else budget
+        queue = [(0, scan_rank[start_id], start_id)]
+        settled_count = relaxed = pushes = 0
+        while queue:
+            current_distance, _, current = heapq.heappop(queue)
+            if current_distance > limit:
+                break
+            if settled[current]:
+                continue
+            settled[current] = True
+            settled_count += 1
+            if current == finish_id:
+                break
+            adjacency = self.open_adjacency[current]
+            relaxed += len(adjacency)
+            for node, weight, line in adjacency:
+                # The '+ 1' takes into account of the time needed to wait at each station.
+                next_path = current_distance + weight + 1
+                # Like the original engine, an equally short route replaces the current one. The station is only
+                # pushed again when its distance actually goes down.
+                if next_path <= distance[node] and not settled[node]:
+                    if next_path < distance[node]:
+                        heapq.heappush(queue, (next_path, scan_rank[node], node))
+                        pushes += 1
+                    distance[node] = next_path
+                    previous[node] = current
+                    via_line[node] = line
+        return distance, previous, via_line, SearchCounts(settled_count, relaxed, pushes)
+
+    def _search_timed(self, start_id, finish_id, departure, budget=None):
+        # The same as the 'heap' engine, except each edge's time is scaled by its line's speed profile at the minute
+        # of the day the train leaves.
+        distance, previous, via_line = self._new_state(start_id)
+        settled = [False] * len(self.stations)
+        scan_rank = self.scan_rank
+        speed_tables = self.speed_tables
+        limit = float("inf") if budget is None else budget
+        queue = [(0, scan_rank[start_id], start_id)]
+        settled_count = relaxed = pushes = 0
+        while queue:
+            current_distance, _, current = heapq.heappop(queue)
+            if current_distance > limit:
+                break
+            if settled[current]:
+                continue
+            settled[current] = True
+            settled_count += 1
+            if current == finish_id:
+                break
+            minute = int(departure + current_distance) % MINUTES_PER_DAY
+            adjacency = self.open_adjacency[current]
+            relaxed += len(adjacency)
+            for node, weight, line in adjacency:
+                table = speed_tables.get(line)
+                if table is not None:
+                    weight = weight * table[minute]
+                # The '+ 1' takes into account of the time needed to wait at each station.
+                next_path = current_distance + weight + 1
+                if next_path <= distance[node] and not settled[node]:
+                    if next_path < distance[node]:
+                        heapq.heappush(queue, (next_path, scan_rank[node], node))
+                        pushes += 1
+                    distance[node] = next_path
+                    previous[node] = current
+                    via_line[node] = line
+        return distance, previous, via_line, SearchCounts(settled_count, relaxed, pushes)
+
+    def _search_bucket(self, start_id, finish_id):
+        if self.weight_scale is None:
+            raise ValueError("The 'bucket' engine needs edge weights that can be scaled to whole numbers.")
+        distance, previous, via_line = self._new_state(start_id)
+        settled = [False] * len(self.stations)
+        # Dial's algorithm - a circular array of buckets, one per (scaled) minute. A step never spans more than the
+        # largest weight plus the 1 minute wait, so that many buckets are enough to hold every pending station. Each
+        # bucket is a heap of (scan rank, station ID), so stations the same time away are settled in the same order as
+        # the 'heap' and 'linear' engines and ties between equally quick routes go the same way.
+        scale = self.weight_scale
+        scan_rank = self.scan_rank
+        width = int(max((edge.weight for edge in self.edges), default=0) * scale) + scale + 1
+        buckets = [[] for _ in range(width)]
+        key = [None] * len(self.stations)
+        key[start_id] = 0
+        buckets[0].append((scan_rank[start_id], start_id))
+        pending = 1
+        position = 0
+        settled_count = relaxed = pushes = 0
+        while pending:
+            # Moves on to the next bucket that has something in it.
+            while not buckets[position % width]:
+                position += 1
+            _, current = heapq.heappop(buckets[position % width])
+            pending -= 1
+            if settled[current] or key[current] != position:
+                continue
+            settled[current] = True
+            settled_count += 1
+            if current == finish_id:
+                break
+            adjacency = self.open_adjacency[current]
+            relaxed += len(adjacency)
+            for node, weight, line in adjacency:
+                # The '+ 1' takes into account of the time needed to wait at each station.
+                next_path = distance[current] + weight + 1
+                if next_path <= distance[node] and not settled[node]:
+                    if next_path < distance[node]:
+                        key[node] = position + int(round((weight + 1) * scale))
+                        heapq.heappush(buckets[key[node] % width], (scan_rank[node], node))
+                        pending += 1
+                        pushes += 1
+                    distance[node] = next_path
+                    previous[node] = current
+                    via_line[node] = line
+        return distance, previous, via_line, SearchCounts(settled_count, relaxed, pushes)
+
+    def _search_bidirectional(self, start_id, finish_id):
+        # Searches forwards from the start and backwards from the finish at the same time, always growing whichever
+        # side is closer to its origin, until the best route found through a station reached by both can't be beaten.
+        forward = {start_id: 0}
+        backward = {finish_id: 0}
+        forward_settled = set()
+        backward_settled = set()
+        forward_queue = [(0, start_id)]
+        backward_queue = [(0, finish_id)]
+        best = 0 if start_id == finish_id else float("inf")
+        backward_radius = 0
+        relaxed = pushes = 0
+        while forward_queue and backward_queue and forward_queue[0][0] + backward_queue[0][0] < best:
+            if forward_queue[0][0] <= backward_queue[0][0]:
+                distance, settled, queue, other = forward, forward_settled, forward_queue, backward
+            else:
+                distance, settled, queue, other = backward, backward_settled, backward_queue, forward
+            current_distance, current = heapq.heappop(queue)
+            if current in settled:
+                continue
+            settled.add(current)
+            if queue is backward_queue:
+                backward_radius = current_distance
+            adjacency = self.open_adjacency[current]
+            relaxed += len(adjacency)
+            for node, weight, line in adjacency:
+                # The '+ 1' takes into account of the time needed to wait at each station.
+                next_path = current_distance + weight + 1
+                if next_path < distance.get(node, float("inf")):
+                    distance[node] = next_path
+                    heapq.heappush(queue, (next_path, node))
+                    pushes += 1
+                if node in other:
+                    best = min(best, next_path + other[node])
+        if best == float("inf"):
+            counts = SearchCounts(len(forward_settled) + len(backward_settled), relaxed, pushes)
+            return self._unreachable_state(start_id, finish_id, counts)
+
+        # Nothing the backward search hasn't settled can be closer to the finish than the last station it settled, so
+        # the backward distances make an exact heuristic near the finish and a lower bound everywhere else.
+        def heuristic(station_id):
+            return backward[station_id] if station_id in backward_settled else backward_radius
+        _, finishing_relaxed, finishing_pushes = self._settle_shortest_paths(start_id, forward, forward_settled,
+                                                                             heuristic, best)
+        counts = SearchCounts(len(forward_settled) + len(backward_settled), relaxed + finishing_relaxed,
+                              pushes + finishing_pushes)
+        return self._canonical_state(start_id, finish_id, forward, counts)
+
+    def precompute_landmarks(self, count=4):
+        """
+        Chooses 'count' landmark stations for the 'alt' engine, each as far as possible from the ones already chosen,
+        and stores the travel time from each landmark to every station.
+        """
+        self.landmarks = []
+        self.landmark_distances = []
+        if not self.stations:
+            return
+        # Starts from an arbitrary station, so the first landmark is the one furthest from it - usually at the end of a
+        # line. After that, 'nearest' is how far each station is from its closest landmark.
+        nearest = self._search_heap(0, None)[0]
+        for index in range(min(count, len(self.stations))):
+            landmark = max(range(len(self.stations)),
+                           key=lambda station_id: nearest[station_id] if nearest[station_id] != float("inf") else -1)
+            distances = self._search_heap(landmark, None)[0]
+            self.landmarks.append(landmark)
+            self.landmark_distances.append(distances)
+            nearest = distances if index == 0 else [min(pair) for pair in zip(nearest, distances)]
+
+    def _search_alt(self, start_id, finish_id):
+        # A* search, using the triangle inequality with each landmark's travel times as a lower bound on the time left.
+        if self.landmark_distances is None:
+            self.precompute_landmarks()
+        finish_distances = [distances[finish_id] for distances in self.landmark_distances]
+
+        def heuristic(station_id):
+            bound = 0
+            for distances, finish_distance in zip(self.landmark_distances, finish_distances):
+                if (distances[station_id] == float("inf")) != (finish_distance == float("inf")):
+                    return float("inf")
+                if finish_distance != float("inf"):
+                    bound = max(bound, abs(finish_distance - distances[station_id]))
+            return bound
+        distance = {start_id: 0}
+        settled = set()
+        best, relaxed, pushes = self._settle_shortest_paths(start_id, distance, settled, heuristic, None, finish_id)
+        if best == float("inf"):
+            return self._unreachable_state(start_id, finish_id, SearchCounts(len(settled), relaxed, pushes))
+        return self._canonical_state(start_id, finish_id, distance, SearchCounts(len(settled), relaxed, pushes))
+
+    def _settle_shortest_paths(self, start_id, distance, settled, heuristic, best, finish_id=None):
+        """
+        Runs (or carries on) a forward A* search with a consistent heuristic until every station with an estimated
+        total of at most 'best' is settled, which includes every station on every shortest route. If 'best' isn't
+        known yet, it becomes the distance of 'finish_id' once that is settled. Returns 'best' and the number of edges
+        relaxed and queue entries pushed.
+        """
+        estimate = {}
+        queue = []
+        for station_id, station_distance in distance.items():
+            if station_id not in settled:
+                estimate[station_id] = heuristic(station_id)
+                heapq.heappush(queue, (station_distance + estimate[station_id], station_distance, station_id))
+        relaxed = 0
+        pushes = len(queue)
+        while queue:
+            total, current_distance, current = heapq.heappop(queue)
+            if best is not None and total > best:
+                break
+            if current in settled or current_distance > distance[current]:
+                continue
+            settled.add(current)
+            if current == finish_id:
+                best = current_distance
+            adjacency = self.open_adjacency[current]
+            relaxed += len(adjacency)
+            for node, weight, line in adjacency:
+                if node in settled:
+                    continue
+                # The '+ 1' takes into account of the time needed to wait at each station.
+                next_path = current_distance + weight + 1
+                if next_path < distance.get(node, float("inf")):
+                    distance[node] = next_path
+                    if node not in estimate:
+                        estimate[node] = heuristic(node)
+                    if estimate[node] != float("inf"):
+                        heapq.heappush(queue, (next_path + estimate[node], next_path, node))
+                        pushes += 1
+        return float("inf") if best is None else best, relaxed, pushes
+
+    def _canonical_state(self, start_id, finish_id, distance, counts):
+        """
+        Rebuilds the route the 'heap' engine would pick from exact distances to every station on a shortest route.
+        The 'heap' engine keeps the last equally short route it finds, so each station's previous stop is the one the
+        engine would have settled last - the furthest from the start, then the highest scan rank - and between two
+        lines from that stop, the one later in its neighbour list.
+        """
+        previous = {start_id: None}
+        via_line = {start_id: None}
+        current = finish_id
+        while current != start_id:
+            best_key = None
+            for node, weight, line in self.open_adjacency[current]:
+                if node in distance and distance[node] + weight + 1 == distance[current]:
+                    position = self.open_adjacency[node].index((current, weight, line))
+                    key = (distance[node], self.scan_rank[node], position)
+                    if best_key is None or key > best_key:
+                        best_key = key
+                        previous[current] = node
+                        via_line[current] = line
+            current = previous[current]
+        return distance, previous, via_line, counts
+
+    def _unreachable_state(self, start_id, finish_id, counts):
+        distance = {start_id: 0, finish_id: float("inf")}
+        return distance, {finish_id: None}, {finish_id: None}, counts
+
+    def _search_matrix(self, start_id, finish_id):
+        if self.distance_matrix is None:
+            raise ValueError("The 'matrix' engine needs 'precompute_all_pairs' to be called first.")
+        # Unpacks the start station's row of each matrix into the same per-query state the other engines return.
+        distance = [value / self.weight_scale if value >= 0 else float("inf")
+                    for value in self.distance_matrix[start_id].tolist()]
+        previous = [value if value >= 0 else None for value in self.predecessor_matrix[start_id].tolist()]
+        via_line = [self.lines[value] if value >= 0 else None for value in self.line_matrix[start_id].tolist()]
+        distance[start_id] = 0
+        return distance, previous, via_line, SearchCounts(0, 0, 0)
+
+    def precompute_all_pairs(self, workers=None):
+        """
+        Runs a full search from every station and stores the results as NumPy matrices, indexed by the station IDs in
+        'self.stations'. Travel times are stored multiplied by 'self.weight_scale' so they fit in an integer array and
+        unreachable stations are marked with -1. 'workers' is the number of processes to use (all CPUs by default).
+        """
+        # NumPy is only needed here, so it isn't imported until the matrices are built.
+        import numpy as np
+        if self.weight_scale is None:
+            raise ValueError("The all-pairs matrices need edge weights that can be scaled to whole numbers.")
+        blocks = self._map_sources(_all_pairs_rows, list(range(len(self.stations))), workers)
+        self.distance_matrix = np.concatenate([block[0] for block in blocks])
+        self.predecessor_matrix = np.concatenate([block[1] for block in blocks])
+        self.line_matrix = np.concatenate([block[2] for block in blocks])
+
+    def _map_sources(self, function, sources, workers, *args):
+        """
+        Calls 'function(graph, sources, *args)' on chunks of the source station IDs and returns the results in order.
+        With more than one worker (all CPUs if 'workers' is None), each chunk is run in a process pool where every
+        process builds its own copy of the graph, closures included.
+        """
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(sources) < 2:
+            return [function(self, sources, *args)] if sources else []
+        # Process pools pull in multiprocessing, which is slow to import, so it is only done when one is needed.
+        from concurrent.futures import ProcessPoolExecutor
+        # Splits the stations into a few chunks per process so the work stays evenly spread.
+        chunk = -(-len(sources) // (workers * 4)) or 1
+        chunks = [sources[i:i + chunk] for i in range(0, len(sources), chunk)]
+        raw_edges = [tuple(edge) for edge in self.edges]
+        raw_nodes = [tuple(node) for node in self.nodes]
+        closures = ([self.stations[station_id] for station_id in self.closed_stations], list(self.closed_lines),
+                    [self.edge_ends[index] + (self.edges[index].line,) for index in self.closed_edges])
+        with ProcessPoolExecutor(workers, initializer=_start_worker, initargs=(raw_edges, raw_nodes, closures)) as pool:
+            return list(pool.map(_worker_call, [function] * len(chunks), chunks, [args] * len(chunks)))
+
+    def precompute_hierarchy(self, witness_limit=60):
+        """
+        Builds a contraction hierarchy for the 'hierarchy' engine. Stations are contracted one at a time, least
+        important first, and a shortcut is added between two of a station's neighbours whenever the only shortest route
+        between them went through it. Each shortcut remembers the two edges it replaces, so any route through the
+        hierarchy unpacks back into the original line segments.
+
+        'witness_limit' caps how many stations each witness search settles. A lower cap makes preprocessing quicker
+        but may add shortcuts that aren't needed. It never affects the routes.
+        """
+        if self.weight_scale is None:
+            raise ValueError("The contraction hierarchy needs edge weights that can be scaled to whole numbers.")
+        scale = self.weight_scale
+        # The hierarchy's edges, undirected. Original edges keep their line's ID; shortcuts keep the station they skip
+        # and the two edges either side of it, from 'tail' to 'middle' and from 'middle' to 'head'.
+        edges = []
+        # The remaining graph while contracting - for each station, its neighbours mapped to the (cost, edge index) of
+        # the edge between them. Only the quickest of any parallel edges is kept, as the line doesn't change the time.
+        remaining = [{} for _ in self.stations]
+        for index, (start_id, end_id) in enumerate(self.edge_ends):
+            if start_id == end_id or not self._edge_open(index):
+                continue
+            cost = int(round((self.edges[index].weight + 1) * scale))
+            if cost < remaining[start_id].get(end_id, (float("inf"),))[0]:
+                remaining[start_id][end_id] = remaining[end_id][start_id] = (cost, len(edges))
+                edges.append(HierarchyEdge(start_id, end_id, cost, -1, -1, -1, self.line_ids[self.edges[index].line]))
+
+        def shortcuts(station_id):
+            # Returns the (neighbour, neighbour, cost) shortcuts that contracting the station would need.
+            neighbours = [(node, cost) for node, (cost, _) in remaining[station_id].items()]
+            needed = []
+            for index, (first, first_cost) in enumerate(neighbours):
+                targets = {node: first_cost + cost for node, cost in neighbours[index + 1:]}
+                if not targets:
+                    continue
+                # A witness search - a Dijkstra search from one neighbour that avoids the station being contracted. It
+                # stops once every other neighbour is settled or it is past the longest route through the station.
+                limit = max(targets.values())
+                unsettled = len(targets)
+                distance = {first: 0}
+                queue = [(0, first)]
+                settled = 0
+                while queue and unsettled and settled < witness_limit:
+                    current_distance, current = heapq.heappop(queue)
+                    if current_distance > limit:
+                        break
+                    if current_distance > distance[current]:
+                        continue
+                    settled += 1
+                    if current in targets:
+                        unsettled -= 1
+                    for node, (cost, _) in remaining[current].items():
+                        next_path = current_distance + cost
+                        if node != station_id and next_path < distance.get(node, float("inf")):
+                            distance[node] = next_path
+                            heapq.heappush(queue, (next_path, node))
+                needed.extend((first, node, cost) for node, cost in targets.items()
+                              if distance.get(node, float("inf")) > cost)
+            return needed
+
+        # The order is chosen greedily by the edge difference (shortcuts added less edges removed), plus the number of
+        # neighbours already contracted and how many levels of contracted stations lie below each one, which keeps
+        # the hierarchy shallow and spread evenly over the network. Priorities go stale as the graph changes, so each
+        # one is recomputed when it reaches the front of the queue.
+        contracted_neighbours = [0] * len(self.stations)
+        level = [0] * len(self.stations)
+
+        def priority(station_id):
+            needed = shortcuts(station_id)
+            return (2 * (len(needed) - len(remaining[station_id])) + contracted_neighbours[station_id]
+                    + level[station_id]), needed
+        queue = [(priority(station_id)[0], station_id) for station_id in range(len(self.stations))]
+        heapq.heapify(queue)
+        rank = [0] * len(self.stations)
+        upward = [[] for _ in self.stations]
+        order = 0
+        while queue:
+            _, station_id = heapq.heappop(queue)
+            current_priority, needed = priority(station_id)
+            if queue and current_priority > queue[0][0]:
+                heapq.heappush(queue, (current_priority, station_id))
+                continue
+            for first, second, cost in needed:
+                if cost < remaining[first].get(second, (float("inf"),))[0]:
+                    remaining[first][second] = remaining[second][first] = (cost, len(edges))
+                    edges.append(HierarchyEdge(first, second, cost, station_id, remaining[first][station_id][1],
+                                               remaining[station_id][second][1], -1))
+            # Every station still left will be contracted later, so each remaining edge leads upwards.
+            for node, (cost, edge) in remaining[station_id].items():
+                upward[station_id].append((node, cost, edge))
+                del remaining[node][station_id]
+                contracted_neighbours[node] += 1
+                level[node] = max(level[node], level[station_id] + 1)
+            remaining[station_id] = {}
+            rank[station_id] = order
+            order += 1
+        self.hierarchy_rank = rank
+        self.hierarchy_edges = edges
+        self.hierarchy_upward = upward
+        self._rank_arrivals()
+
+    def _rank_arrivals(self):
+        # For each station, the (scaled cost, neighbour, line) of every way into it, in the order the 'heap' engine
+        # prefers them when routes tie - the shortest step first (its previous stop is settled last), then the highest
+        # scan rank, then the entry later in the neighbour's list.
+        scale = self.weight_scale
+        self.hierarchy_arrivals = []
+        for station_id, entries in enumerate(self.open_adjacency):
+            arrivals = []
+            for node, weight, line in entries:
+                position = self.open_adjacency[node].index((station_id, weight, line))
+                arrivals.append((int(round((weight + 1) * scale)), -self.scan_rank[node], -position, node, line))
+            arrivals.sort()
+            self.hierarchy_arrivals.append([(cost, node, line) for cost, _, _, node, line in arrivals])
+
+    def save_hierarchy(self, path):
+        """
+        Writes the contraction hierarchy to 'path', laid out like the network snapshots in 'Loader' - magic bytes, a
+        JSON header and then each array on an 8 byte boundary. The header records which graph it was built for.
+        """
+        from array import array
+        import tempfile
+        if self.hierarchy_rank is None:
+            self.precompute_hierarchy()
+        header = {"version": HIERARCHY_VERSION, "byteorder": sys.byteorder, "graph": self._hierarchy_key(),
+                  "stations": len(self.hierarchy_rank), "edges": len(self.hierarchy_edges)}
+        header = json.dumps(header).encode("utf-8")
+        # Writes to a temporary file of its own first, like 'Loader.write_snapshot', so a half-written hierarchy is
+        # never picked up and processes saving at the same time can't write over each other's files.
+        descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as output:
+                output.write(HIERARCHY_MAGIC + len(header).to_bytes(4, "little") + header)
+                fields = [self.hierarchy_rank] + [[edge[field] for edge in self.hierarchy_edges]
+                                                  for field in range(len(HierarchyEdge._fields))]
+                for values in fields:
+                    output.write(b"\0" * (-output.tell() % 8))
+                    output.write(array("q", values).tobytes())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def load_hierarchy(self, path):
+        """
+        Reads a contraction hierarchy written by 'save_hierarchy'. Returns False, leaving the graph unchanged, if there
+        isn't one, it was built for a different network or set of closures, or it is damaged (cut short, or with counts
+        or station, edge and line IDs that don't fit the file or the graph).
+        """
+        try:
+            with open(path, "rb") as source:
+                data = source.read()
+        except OSError:
+            return False
+        if data[:len(HIERARCHY_MAGIC)] != HIERARCHY_MAGIC:
+            return False
+        offset = len(HIERARCHY_MAGIC) + 4
+        header_length = int.from_bytes(data[len(HIERARCHY_MAGIC):offset], "little")
+        try:
+            header = json.loads(data[offset:offset + header_length].decode("utf-8"))
+        except ValueError:
+            return False
+        if (not isinstance(header, dict) or header.get("version") != HIERARCHY_VERSION
+                or header.get("byteorder") != sys.byteorder or header.get("graph") != self._hierarchy_key()):
+            return False
+        stations = header.get("stations")
+        edge_count = header.get("edges")
+        if stations != len(self.stations) or not (isinstance(edge_count, int) and edge_count >= 0):
+            return False
+        offset += header_length
+        view = memoryview(data)
+        fields = []
+        # The arrays must fill the rest of the file exactly.
+        for count in [stations] + [edge_count] * len(HierarchyEdge._fields):
+            offset += -offset % 8
+            if offset + count * 8 > len(data):
+                return False
+            fields.append(view[offset:offset + count * 8].cast("q").tolist())
+            offset += count * 8
+        if offset != len(data):
+            return False
+        rank = fields[0]
+        edges = [HierarchyEdge(*edge) for edge in zip(*fields[1:])]
+        if sorted(rank) != list(range(len(self.stations))) or not all(
+                0 <= edge.tail < stations and 0 <= edge.head < stations and edge.cost >= 0
+                and -1 <= edge.middle < stations and -1 <= edge.first < edge_count and -1 <= edge.second < edge_count
+                and -1 <= edge.line < len(self.lines) for edge in edges):
+            return False
+        self.hierarchy_rank = rank
+        self.hierarchy_edges = edges
+        # Edges that were later replaced by a quicker shortcut are only kept for unpacking, so each station leads up
+        # to each of its neighbours by the first of the quickest edges, as it did when the hierarchy was built.
+        quickest = {}
+        for index, edge in enumerate(self.hierarchy_edges):
+            ends = tuple(sorted((edge.tail, edge.head), key=self.hierarchy_rank.__getitem__))
+            if ends not in quickest or edge.cost < self.hierarchy_edges[quickest[ends]].cost:
+                quickest[ends] = index
+        self.hierarchy_upward = [[] for _ in self.stations]
+        for (low, high), index in quickest.items():
+            self.hierarchy_upward[low].append((high, self.hierarchy_edges[index].cost, index))
+        self._rank_arrivals()
+        return True
+
+    def _hierarchy_key(self):
+        # Identifies the stations, the open edges and their weights, which are everything a hierarchy depends on.
+        import hashlib
+        open_edges = [[index, self.edges[index].weight] for index in range(len(self.edges)) if self._edge_open(index)]
+        key = json.dumps([self.stations, [list(ends) for ends in self.edge_ends], open_edges, self.weight_scale])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _search_hierarchy(self, start_id, finish_id):
+        # Searches upwards through the hierarchy from both ends. Every shortest route has a version that only climbs
+        # to its most important station and then only descends, so the two searches meet on it.
+        if self.hierarchy_rank is None:
+            self.precompute_hierarchy()
+        upward = self.hierarchy_upward
+        forward = {start_id: 0}
+        backward = {finish_id: 0}
+        forward_parent = {start_id: None}
+        backward_parent = {finish_id: None}
+        forward_queue = [(0, start_id)]
+        backward_queue = [(0, finish_id)]
+        best = float("inf")
+        meeting = None
+        settled = relaxed = 0
+        pushes = 2
         while True:
-            if current_prev is None:
+            # The forward search carries on through stations exactly as far away as the best route, as its distances
+            # are reused below to pick between equally short routes. The backward search can stop just short of it.
+            forward_open = forward_queue and forward_queue[0][0] <= best
+            backward_open = backward_queue and backward_queue[0][0] < best
+            if forward_open and not (backward_open and backward_queue[0][0] < forward_queue[0][0]):
+                distance, parent, queue, other = forward, forward_parent, forward_queue, backward
+            elif backward_open:
+                distance, parent, queue, other = backward, backward_parent, backward_queue, forward
+            else:
+                break
+            current_distance, current = heapq.heappop(queue)
+            if current_distance > distance[current]:
+                continue
+            settled += 1
+            if current in other and current_distance + other[current] < best:
+                best = current_distance + other[current]
+                meeting = current
+            # Stall-on-demand - if a more important station already has a quicker way down to this one, this one's
+            # distance can't be on a shortest route, so there's no point searching on from it.
+            if any(distance.get(node, float("inf")) + cost < current_distance for node, cost, _ in upward[current]):
+                continue
+            relaxed += len(upward[current])
+            for node, cost, edge in upward[current]:
+                next_path = current_distance + cost
+                if next_path < distance.get(node, float("inf")):
+                    distance[node] = next_path
+                    parent[node] = (current, edge)
+                    heapq.heappush(queue, (next_path, node))
+                    pushes += 1
+        if meeting is None:
+            return self._unreachable_state(start_id, finish_id, SearchCounts(settled, relaxed, pushes))
+
+        # Unpacks the route through the meeting station. Every station on it is on a shortest route, so its distance
+        # from the start is known exactly.
+        exact = {meeting: forward[meeting]}
+        node = meeting
+        while forward_parent[node] is not None:
+            parent, edge = forward_parent[node]
+            reached = exact[node]
+            for step, cost in self._unpack_hierarchy_edge(edge, node):
+                reached -= cost
+                exact[step] = reached
+            node = parent
+        node = meeting
+        while backward_parent[node] is not None:
+            child, edge = backward_parent[node]
+            reached = exact[node]
+            for step, cost in self._unpack_hierarchy_edge(edge, node):
+                reached += cost
+                exact[step] = reached
+            node = child
+
+        # Walks back from the finish choosing each previous stop the way '_canonical_state' does, so the route is the
+        # one the 'heap' engine picks. A stop only needs its distance from the start if it could beat the best one
+        # found so far, and most candidates are on the unpacked route anyway.
+        scale = self.weight_scale
+        distance = {}
+        previous = {start_id: None}
+        via_line = {start_id: None}
+        current = finish_id
+        while current != start_id:
+            distance[current] = exact[current] / scale
+            for cost, node, line in self.hierarchy_arrivals[current]:
+                remainder = exact[current] - cost
+                if remainder < 0:
+                    continue
+                if node not in exact:
+                    settled += self._hierarchy_distance(node, forward, exact)
+                if exact[node] == remainder:
+                    previous[current] = node
+                    via_line[current] = line
+                    break
+            current = previous[current]
+        distance[start_id] = 0
+        return distance, previous, via_line, SearchCounts(settled, relaxed, pushes)
+
+    def _hierarchy_distance(self, station_id, forward, exact):
+        """
+        Works out the station's exact (scaled) distance from the start and stores it in 'exact'. Every shortest route
+        climbs from the start to its most important station and then only descends, so a station's distance is the
+        smaller of the forward search's distance to it and the distances of the stations above it plus the edge down.
+        'exact' is shared between calls, so stations close together mostly reuse each other's work. Returns the number
+        of stations whose distance had to be worked out.
+        """
+        upward = self.hierarchy_upward
+        # Finds every station above this one whose distance isn't known yet, then works them out from the top down -
+        # a station's rank is always below the ranks of the stations above it.
+        found = [station_id]
+        seen = {station_id}
+        stack = [station_id]
+        while stack:
+            for node, _, _ in upward[stack.pop()]:
+                if node not in exact and node not in seen:
+                    seen.add(node)
+                    found.append(node)
+                    stack.append(node)
+        found.sort(key=self.hierarchy_rank.__getitem__, reverse=True)
+        for current in found:
+            best = forward.get(current, float("inf"))
+            for node, cost, _ in upward[current]:
+                if exact[node] + cost < best:
+                    best = exact[node] + cost
+            exact[current] = best
+        return len(found)
+
+    def _unpack_hierarchy_edge(self, edge, start_id):
+        # Returns the (station, scaled cost) of each original step along a hierarchy edge, leaving from 'start_id'.
+        edges = self.hierarchy_edges
+        steps = []
+        stack = [(edge, start_id)]
+        while stack:
+            index, origin = stack.pop()
+            edge = edges[index]
+            if edge.middle < 0:
+                steps.append((edge.head if origin == edge.tail else edge.tail, edge.cost))
+            elif origin == edge.tail:
+                stack.append((edge.second, edge.middle))
+                stack.append((edge.first, origin))
+            else:
+                stack.append((edge.first, edge.middle))
+                stack.append((edge.second, origin))
+        return steps
+
+    def precompute_interchanges(self, penalty=INTERCHANGE_PENALTY, transfers=()):
+        """
+        Builds the (station, line) state graph searched by the 'interchange' engine. Riding to the next station keeps
+        the line and takes the edge's time plus the minute at the station, as in the other engines, while changing
+        line at a station takes 'penalty' minutes. 'transfers' are (station, station, minutes) walks between nearby
+        stations, which go both ways from any line at one station to any line at the other and take the walk plus the
+        penalty. A walk at the start or end of a journey has no train to change to, so the search leaves the penalty
+        off it.
+
+        Only junctions (stations with more than one line or neighbour along a line, the ends of lines and the ends of
+        walks) get states, one for each open line through them. The stations in between have nowhere else to go, so
+        each run of them is ridden as a single arc from one junction to the next.
+
+        The graph is laid out in compressed sparse row form, as flat lists of numbers instead of an object per state.
+        Plain lists are quicker to index than the 'array' module's, which has to box every number it reads. The states
+        of station 's' are numbered 'state_offsets[s]' up to 'state_offsets[s + 1]' and 'state_lines' holds each
+        state's line ID. The arcs leaving state 'i' are numbered 'arc_offsets[i]' up to 'arc_offsets[i + 1]', with its
+        rides first, up to 'ride_ends[i]'. 'arc_targets', 'arc_costs' and 'arc_lines' hold the state each arc leads
+        to, its time and its line ID (-1 for a change of line and -2 for a walk). The stations ride 'a' passes through
+        are 'step_stations[step_offsets[a]]' up to 'step_offsets[a + 1]', ending with the junction it leads to, and
+        'step_weights' holds the edge weight to each of them. For each station between junctions, 'chain_steps' holds
+        the two rides through it (one each way) and the step on which each one reaches it, or -1 for junctions.
+        """
+        if penalty < 0:
+            raise ValueError(penalty, " is not a valid interchange penalty.")
+        adjacency = self.open_adjacency
+        walks = [[] for _ in self.stations]
+        for start, end, minutes in transfers:
+            start_id = self._station_id(start)
+            end_id = self._station_id(end)
+            # A walk has to take some time, otherwise a route could go round in a circle for free.
+            if not minutes > 0:
+                raise ValueError(minutes, " is not a valid walking time.")
+            walks[start_id].append((end_id, minutes))
+            walks[end_id].append((start_id, minutes))
+        junction = [bool(walks[station_id]) or not (len(entries) == 2 and entries[0][2] == entries[1][2]
+                                                    and entries[0][0] != entries[1][0])
+                    for station_id, entries in enumerate(adjacency)]
+
+        def next_stop(previous_id, station_id):
+            # The neighbour of a station between junctions that the line carries on to.
+            return next(entry for entry in adjacency[station_id] if entry[0] != previous_id)
+
+        # A loop of stations with no junction on it gets one, so it can still be searched.
+        checked = list(junction)
+        for station_id in range(len(self.stations)):
+            if checked[station_id]:
+                continue
+            checked[station_id] = True
+            for entry in adjacency[station_id]:
+                previous_id, node = station_id, entry[0]
+                while not junction[node] and node != station_id:
+                    checked[node] = True
+                    previous_id, node = node, next_stop(previous_id, node)[0]
+                if node == station_id:
+                    junction[station_id] = True
+                    break
+
+        station_lines = [sorted(set(self.line_ids[line] for _, _, line in adjacency[station_id]))
+                         if junction[station_id] else [] for station_id in range(len(self.stations))]
+        state_offsets = [0]
+        state_ids = {}
+        for station_id, line_ids in enumerate(station_lines):
+            for line_id in line_ids:
+                state_ids[station_id, line_id] = len(state_ids)
+            state_offsets.append(len(state_ids))
+        state_lines = [line_id for line_ids in station_lines for line_id in line_ids]
+        arc_offsets = [0]
+        ride_ends = []
+        arc_targets = []
+        arc_costs = []
+        arc_lines = []
+        step_offsets = [0]
+        step_stations = []
+        step_weights = []
+        chain_steps = [-1] * (4 * len(self.stations))
+        for station_id, line_ids in enumerate(station_lines):
+            for line_id in line_ids:
+                for node, weight, line in adjacency[station_id]:
+                    if self.line_ids[line] != line_id:
+                        continue
+                    # Rides along the line, through the stations after this one, up to the next junction.
+                    previous_id = station_id
+                    cost = 0
+                    while True:
+                        # The '+ 1' takes into account of the time needed to wait at each station.
+                        cost += weight + 1
+                        step_stations.append(node)
+                        step_weights.append(weight)
+                        if junction[node]:
+                            break
+                        slot = 4 * node + (0 if chain_steps[4 * node] == -1 else 2)
+                        chain_steps[slot] = len(arc_targets)
+                        chain_steps[slot + 1] = len(step_stations) - 1
+                        previous_id, (node, weight, _) = node, next_stop(previous_id, node)
+                    arc_targets.append(state_ids[node, line_id])
+                    arc_costs.append(cost)
+                    arc_lines.append(line_id)
+                    step_offsets.append(len(step_stations))
+                ride_ends.append(len(arc_targets))
+                changes = [(state_ids[station_id, other], penalty, -1) for other in line_ids if other != line_id]
+                changes += [(state_ids[node, other], minutes + penalty, -2)
+                            for node, minutes in walks[station_id] for other in station_lines[node]]
+                for target, cost, arc_line in changes:
+                    arc_targets.append(target)
+                    arc_costs.append(cost)
+                    arc_lines.append(arc_line)
+                    step_offsets.append(len(step_stations))
+                arc_offsets.append(len(arc_targets))
+        self.interchange_settings = (penalty, tuple(transfers))
+        self.state_offsets = state_offsets
+        self.state_lines = state_lines
+        self.arc_offsets = arc_offsets
+        self.ride_ends = ride_ends
+        self.arc_targets = arc_targets
+        self.arc_costs = arc_costs
+        self.arc_lines = arc_lines
+        self.step_offsets = step_offsets
+        self.step_stations = step_stations
+        self.step_weights = step_weights
+        self.chain_steps = chain_steps
+
+    def _search_interchange(self, start_id, finish_id, departure=None):
+        # A heap search over the junction states of the (station, line) graph. A start or finish between junctions is
+        # joined to the junctions either side of it along its line, and one with walks is joined to the stations it
+        # walks to, without the penalty. If 'departure' is given, each ride follows its line's speed profile like the
+        # 'heap' engine's timed search.
+        if self.state_offsets is None:
+            self.precompute_interchanges(*self.interchange_settings)
+        if start_id == finish_id:
+            return {start_id: 0}, {start_id: None}, {start_id: None}, SearchCounts(1, 0, 0)
+        state_offsets = self.state_offsets
+        arc_offsets = self.arc_offsets
+        ride_ends = self.ride_ends
+        arc_targets = self.arc_targets
+        arc_costs = self.arc_costs
+        arc_lines = self.arc_lines
+        step_offsets = self.step_offsets
+        chain_steps = self.chain_steps
+        penalty = self.interchange_settings[0]
+        distance = [float("inf")] * len(self.state_lines)
+        # The arc each state was reached along, or -1.
+        previous = [-1] * len(self.state_lines)
+        # The rides that join a start between junctions to the junctions either side - for each state they reach, the
+        # arc and the step after the start.
+        seeds = {}
+        queue = []
+        starts = [(arc, step) for arc, step in zip(chain_steps[4 * start_id:4 * start_id + 4:2],
+                                                    chain_steps[4 * start_id + 1:4 * start_id + 4:2]) if arc != -1]
+        finishes = [(arc, step) for arc, step in zip(chain_steps[4 * finish_id:4 * finish_id + 4:2],
+                                                     chain_steps[4 * finish_id + 1:4 * finish_id + 4:2]) if arc != -1]
+        for state in range(state_offsets[start_id], state_offsets[start_id + 1]):
+            distance[state] = 0
+            queue.append((0, state))
+        for state in range(state_offsets[start_id], state_offsets[start_id + 1]):
+            for arc in range(ride_ends[state], arc_offsets[state + 1]):
+                node = arc_targets[arc]
+                if arc_lines[arc] == -2 and arc_costs[arc] - penalty < distance[node]:
+                    distance[node] = arc_costs[arc] - penalty
+                    previous[node] = arc
+                    heapq.heappush(queue, (distance[node], node))
+        for arc, step in starts:
+            node = arc_targets[arc]
+            reached = self._ride_time(arc, step + 1, step_offsets[arc + 1], 0, departure)
+            if reached < distance[node]:
+                distance[node] = reached
+                seeds[node] = (arc, step + 1)
+                heapq.heappush(queue, (reached, node))
+        # The best way found so far into the finish - its time and the (state, arc, first step, end step) it ends with.
+        # The state is None for a ride straight from the start, and the arc is None when the state is at the finish.
+        best = float("inf")
+        best_end = None
+        for arc, step in starts:
+            for finish_arc, finish_step in finishes:
+                if arc == finish_arc and step < finish_step:
+                    best = self._ride_time(arc, step + 1, finish_step + 1, 0, departure)
+                    best_end = (None, arc, step + 1, finish_step + 1)
+        # The states the finish is reached from, with the ride or walk (if any) still to go from each. A walk's end step
+        # is None.
+        finishing = {state: [(None, None)] for state in range(state_offsets[finish_id], state_offsets[finish_id + 1])}
+        for arc, step in finishes:
+            # The state a ride leaves from is the one whose block of arcs it falls in.
+            finishing.setdefault(bisect_right(arc_offsets, arc) - 1, []).append((arc, step + 1))
+        # Walks go both ways, so the walks into the finish leave from the states the finish's own walks lead to.
+        for state in range(state_offsets[finish_id], state_offsets[finish_id + 1]):
+            for arc in range(ride_ends[state], arc_offsets[state + 1]):
+                source = arc_targets[arc]
+                if arc_lines[arc] != -2 or any(end is None for _, end in finishing.get(source, ())):
+                    continue
+                walk = min((walk for walk in range(ride_ends[source], arc_offsets[source + 1])
+                            if arc_lines[walk] == -2
+                            and state_offsets[finish_id] <= arc_targets[walk] < state_offsets[finish_id + 1]),
+                           key=arc_costs.__getitem__)
+                finishing.setdefault(source, []).append((walk, None))
+        settled_count = relaxed = pushes = 0
+        while queue:
+            current_distance, current = heapq.heappop(queue)
+            if current_distance >= best:
                 break
-            station1 = next((x for x in all_station_data if x.station_name == current_prev), None)
-            shortest_path.add_first(current_prev)
-            stepped_dist.add_first(station1.distance)
-            if station1.via_line is not None:
-                stepped_line.add_first(station1.via_line)
+            if current_distance > distance[current]:
+                continue
+            settled_count += 1
+            if current in finishing:
+                for arc, end in finishing[current]:
+                    if arc is None:
+                        arrival = current_distance
+                    elif end is None:
+                        arrival = current_distance + arc_costs[arc] - penalty
+                    else:
+                        arrival = self._ride_time(arc, step_offsets[arc], end, current_distance, departure)
+                    if arrival < best:
+                        best = arrival
+                        best_end = (current, arc, None if arc is None else step_offsets[arc], end)
+                # Nothing can be quicker than a state at the finish itself.
+                if best == current_distance:
+                    break
+            first_arc = arc_offsets[current]
+            # A state reached by changing line gains nothing from changing or walking again - the state it changed
+            # from has already done that for less - so only its rides are followed.
+            arrived_by = previous[current]
+            if arrived_by != -1 and arc_lines[arrived_by] == -1:
+                last_arc = ride_ends[current]
             else:
-                stepped_line.add_first(stepped_line.get_head())
-            current_prev = station1.previous
+                last_arc = arc_offsets[current + 1]
+            relaxed += last_arc - first_arc
+            if departure is None:
+                for arc in range(first_arc, last_arc):
+                    node = arc_targets[arc]
+                    next_path = current_distance + arc_costs[arc]
+                    if next_path < distance[node]:
+                        distance[node] = next_path
+                        previous[node] = arc
+                        heapq.heappush(queue, (next_path, node))
+                        pushes += 1
+                continue
+            # With a departure time, the rides are timed step by step as each one's time depends on when it sets off.
+            for arc in range(first_arc, last_arc):
+                node = arc_targets[arc]
+                if arc_lines[arc] < 0:
+                    next_path = current_distance + arc_costs[arc]
+                else:
+                    next_path = self._ride_time(arc, step_offsets[arc], step_offsets[arc + 1], current_distance,
+                                                departure)
+                if next_path < distance[node]:
+                    distance[node] = next_path
+                    previous[node] = arc
+                    heapq.heappush(queue, (next_path, node))
+                    pushes += 1
+        counts = SearchCounts(settled_count, relaxed, pushes)
+        if best_end is None:
+            return self._unreachable_state(start_id, finish_id, counts)
+        return self._interchange_state(start_id, finish_id, best, best_end, distance, previous, seeds, departure) + (
+            counts,)
+
+    def _ride_time(self, arc, first, end, elapsed, departure):
+        # Returns the time after riding from step 'first' up to (but not including) step 'end' of a ride, setting off
+        # at 'elapsed'. With a 'departure', each step follows the line's speed profile at the minute the train leaves.
+        weights = self.step_weights
+        table = None if departure is None else self.speed_tables.get(self.lines[self.arc_lines[arc]])
+        if table is None:
+            for step in range(first, end):
+                elapsed += weights[step] + 1
+        else:
+            for step in range(first, end):
+                elapsed += weights[step] * table[int(departure + elapsed) % MINUTES_PER_DAY] + 1
+        return elapsed
+
+    def _interchange_state(self, start_id, finish_id, best, best_end, distance, previous, seeds, departure):
+        # Turns the best route into the per-station state the other engines return, riding each arc again to find
+        # the time at every station it passes. A change of line stays at the same station, so each station keeps the
+        # time it was first arrived at. A walk arrives after the walk alone - the penalty for the train after it is
+        # part of that train's ride, as it is after a change of line (or of the next walk, if two walks follow on).
+        state, arc, first, end = best_end
+        # The route as (arc, first step, end step, time setting off) legs, found from the finish back to the start.
+        legs = []
+        if arc is not None:
+            legs.append((arc, first, end, 0 if state is None else distance[state]))
+        while state is not None and previous[state] != -1:
+            arc = previous[state]
+            state = bisect_right(self.arc_offsets, arc) - 1
+            legs.append((arc, self.step_offsets[arc], self.step_offsets[arc + 1], distance[state]))
+        if state in seeds:
+            arc, first = seeds[state]
+            legs.append((arc, first, self.step_offsets[arc + 1], 0))
+        distance_by_station = {start_id: 0}
+        previous_by_station = {start_id: None}
+        via_line = {start_id: None}
+        current = start_id
+        for arc, first, end, elapsed in reversed(legs):
+            line_id = self.arc_lines[arc]
+            if line_id == -1:
+                continue
+            if line_id == -2:
+                station_id = bisect_right(self.state_offsets, self.arc_targets[arc]) - 1
+                distance_by_station[station_id] = elapsed + self.arc_costs[arc] - self.interchange_settings[0]
+                previous_by_station[station_id] = current
+                via_line[station_id] = WALK
+                current = station_id
+                continue
+            line = self.lines[line_id]
+            table = None if departure is None else self.speed_tables.get(line)
+            for station_id, weight in zip(self.step_stations[first:end], self.step_weights[first:end]):
+                if table is not None:
+                    weight = weight * table[int(departure + elapsed) % MINUTES_PER_DAY]
+                elapsed += weight + 1
+                distance_by_station[station_id] = elapsed
+                previous_by_station[station_id] = current
+                via_line[station_id] = line
+                current = station_id
+        distance_by_station[finish_id] = best
+        return distance_by_station, previous_by_station, via_line
+
+    def close_station(self, station):
+        # Closes a station - no route can start, finish or pass through it until it is reopened.
+        station_id = self._station_id(station)
+        self._change_closures(self.station_edges[station_id], lambda: self.closed_stations.add(station_id))
+
+    def reopen_station(self, station):
+        station_id = self._station_id(station)
+        self._change_closures(self.station_edges[station_id], lambda: self.closed_stations.discard(station_id))
+
+    def close_line(self, line):
+        # Closes every edge on a train line.
+        self._change_closures(self._line_edges(line), lambda: self.closed_lines.add(line))
+
+    def reopen_line(self, line):
+        self._change_closures(self._line_edges(line), lambda: self.closed_lines.discard(line))
+
+    def close_edge(self, start, end, line=None):
+        # Closes the edges between two neighbouring stations - only the one on 'line' if it's given.
+        edges = self._edges_between(start, end, line)
+        self._change_closures(edges, lambda: self.closed_edges.update(edges))
+
+    def reopen_edge(self, start, end, line=None):
+        edges = self._edges_between(start, end, line)
+        self._change_closures(edges, lambda: self.closed_edges.difference_update(edges))
+
+    def _station_id(self, station):
+        if station not in self.station_ids:
+            raise ValueError(station, " not found.")
+        return self.station_ids[station]
+
+    def _line_edges(self, line):
+        if line not in self.line_edges:
+            raise ValueError(line, " not found.")
+        return self.line_edges[line]
+
+    def _edges_between(self, start, end, line):
+        start_id = self._station_id(start)
+        end_id = self._station_id(end)
+        edges = [index for index in self.station_edges[start_id] if set(self.edge_ends[index]) == {start_id, end_id}
+                 and (line is None or self.edges[index].line == line)]
+        if not edges:
+            raise ValueError((start, end, line), " not found.")
+        return edges
+
+    def _edge_open(self, index):
+        start_id, end_id = self.edge_ends[index]
+        return (start_id not in self.closed_stations and end_id not in self.closed_stations
+                and self.edges[index].line not in self.closed_lines and index not in self.closed_edges)
+
+    def _change_closures(self, edges, change):
+        # Applies a change to the closure masks, then updates the open adjacency of the stations at either end of any
+        # edge that opened or closed. The all-pairs matrices are repaired for just the sources that could be affected.
+        was_open = [self._edge_open(index) for index in edges]
+        change()
+        flipped = [index for index, before in zip(edges, was_open) if self._edge_open(index) != before]
+        touched = set(station_id for index in flipped for station_id in self.edge_ends[index])
+        for station_id in touched:
+            if station_id in self.closed_stations:
+                self.open_adjacency[station_id] = []
+                continue
+            neighbours = [entry for entry in self.adjacency[station_id] if self._entry_open(station_id, entry)]
+            # Shares the full list again once nothing at the station is closed.
+            if len(neighbours) == len(self.adjacency[station_id]):
+                neighbours = self.adjacency[station_id]
+            self.open_adjacency[station_id] = neighbours
+        # Landmark distances stay valid lower bounds when edges close, but not when they open.
+        if any(self._edge_open(index) for index in flipped):
+            self.landmarks = None
+            self.landmark_distances = None
+        # The hierarchy's shortcuts depend on every edge, so any change means building it again.
+        if flipped:
+            self.hierarchy_rank = None
+            self.hierarchy_edges = None
+            self.hierarchy_upward = None
+            self.hierarchy_arrivals = None
+            self.state_offsets = None
+        if flipped and self.distance_matrix is not None:
+            self._repair_matrices([index for index in flipped if not self._edge_open(index)],
+                                  [index for index in flipped if self._edge_open(index)])
+
+    def _entry_open(self, station_id, entry):
+        node, _, line = entry
+        if node in self.closed_stations or line in self.closed_lines:
+            return False
+        return not any(set(self.edge_ends[index]) == {station_id, node} and self.edges[index].line == line
+                       for index in self.closed_edges)
+
+    def _repair_matrices(self, closed, opened):
+        """
+        Recomputes the rows of the all-pairs matrices whose shortest path tree could have changed. A newly closed edge
+        only matters to the sources whose tree uses it. A newly opened edge only matters to the sources where it gives
+        one of its ends an equal or shorter route.
+        """
+        import numpy as np
+        scale = self.weight_scale
+        affected = np.zeros(len(self.stations), dtype=bool)
+        # Treats unreachable stations as infinitely far away.
+        distances = np.where(self.distance_matrix >= 0, self.distance_matrix.astype(np.float64), np.inf)
+        for index in closed:
+            start_id, end_id = self.edge_ends[index]
+            line_id = self.line_ids[self.edges[index].line]
+            for station_id, other_id in ((start_id, end_id), (end_id, start_id)):
+                affected |= ((self.predecessor_matrix[:, other_id] == station_id)
+                             & (self.line_matrix[:, other_id] == line_id))
+        for index in opened:
+            start_id, end_id = self.edge_ends[index]
+            step = (self.edges[index].weight + 1) * scale
+            for station_id, other_id in ((start_id, end_id), (end_id, start_id)):
+                reached = np.isfinite(distances[:, station_id])
+                affected |= reached & (distances[:, station_id] + step <= distances[:, other_id])
+        sources = np.flatnonzero(affected).tolist()
+        if sources:
+            rows = _all_pairs_rows(self, sources)
+            self.distance_matrix[sources] = rows[0]
+            self.predecessor_matrix[sources] = rows[1]
+            self.line_matrix[sources] = rows[2]
+
+    def travel_time(self, start, finish):
+        # Returns just the total journey time. This is a single array lookup once the all-pairs matrices are built.
+        assert start in self.station_ids
+        assert finish in self.station_ids
+        if self.distance_matrix is None:
+            return self.dijkstra(start, finish)[3]
+        value = self.distance_matrix[self.station_ids[start], self.station_ids[finish]]
+        return value / self.weight_scale if value >= 0 else float("inf")
+
+    def _trace_path(self, finish_id, distance, previous, via_line):
+        # Creates lists for the shortest path, sum of the time after arriving at each station and the train line at
+        # each station. They're filled in from the target backwards and reversed once at the end.
+        shortest_path = [self.stations[finish_id]]
+        stepped_dist = [distance[finish_id]]
+        stepped_line = [via_line[finish_id]]
+        # Traverses backwards from the target node to locate and store the shortest path.
+        current_prev = previous[finish_id]
+        while current_prev is not None:
+            shortest_path.append(self.stations[current_prev])
+            stepped_dist.append(distance[current_prev])
+            # The starting station wasn't reached by a line, so it takes the line of the first stop after it.
+            if via_line[current_prev] is not None:
+                stepped_line.append(via_line[current_prev])
+            else:
+                stepped_line.append(stepped_line[-1])
+            current_prev = previous[current_prev]
+        shortest_path.reverse()
+        stepped_dist.reverse()
+        stepped_line.reverse()
+
+        return shortest_path, stepped_dist, stepped_line, distance[finish_id]
+
+
+def _all_pairs_rows(graph, sources):
+    # Runs a full heap search from each source and packs the results into integer rows for the all-pairs matrices.
+    import numpy as np
+    count = len(graph.stations)
+    index_type = np.int16 if max(count, len(graph.lines)) < 2 ** 15 else np.int32
+    distances = np.full((len(sources), count), -1, dtype=np.int32)
+    predecessors = np.full((len(sources), count), -1, dtype=index_type)
+    lines = np.full((len(sources), count), -1, dtype=index_type)
+    for row, source in enumerate(sources):
+        distance, previous, via_line, _ = graph._search_heap(source, None)
+        distance = np.array(distance, dtype=np.float64)
+        reached = np.isfinite(distance)
+        distances[row, reached] = np.rint(distance[reached] * graph.weight_scale)
+        predecessors[row] = [-1 if value is None else value for value in previous]
+        lines[row] = [-1 if value is None else graph.line_ids[value] for value in via_line]
+    return distances, predecessors, lines
+
+
+def _distance_rows(graph, sources, targets):
+    # Runs a heap search from each source that only keeps the distances and stops once every target is settled, and
+    # returns the times to the targets as rows of a float matrix.
+    import numpy as np
+    rows = np.full((len(sources), len(targets)), np.inf)
+    wanted = set(targets)
+    scan_rank = graph.scan_rank
+    adjacency = graph.open_adjacency
+    for row, source in enumerate(sources):
+        distance = {source: 0}
+        settled = set()
+        remaining = len(wanted)
+        queue = [(0, scan_rank[source], source)]
+        while queue and remaining:
+            current_distance, _, current = heapq.heappop(queue)
+            if current in settled:
+                continue
+            settled.add(current)
+            if current in wanted:
+                remaining -= 1
+            for node, weight, line in adjacency[current]:
+                # The '+ 1' takes into account of the time needed to wait at each station.
+                next_path = current_distance + weight + 1
+                if next_path < distance.get(node, float("inf")):
+                    distance[node] = next_path
+                    heapq.heappush(queue, (next_path, scan_rank[node], node))
+        rows[row] = [distance[target] if target in settled else np.inf for target in targets]
+    return rows
+
+
+# Each worker process builds its own copy of the graph once, then answers chunks of sources from it.
+_worker_graph = None
+
+
+def _start_worker(edges, nodes, closures):
+    global _worker_graph
+    _worker_graph = Graph(edges, nodes)
+    # Copies the closures of the graph being precomputed.
+    stations, lines, edge_closures = closures
+    for station in stations:
+        _worker_graph.close_station(station)
+    for line in lines:
+        _worker_graph.close_line(line)
+    for start_id, end_id, line in edge_closures:
+        _worker_graph.close_edge(_worker_graph.stations[start_id], _worker_graph.stations[end_id], line)
+
 
-        return shortest_path.traverse_all(), stepped_dist.traverse_all(), stepped_line.traverse_all(), finish_.distance
+def _worker_call(function, sources, args):
+    return function(_worker_graph, sources, *args)
@@ -0,0 +1,209 @@
+from collections import deque
+from contextlib import nullcontext
+from itertools import islice
+import argparse
+import csv
+import json
+import os
+import sys
+import Algorithms as Alg
+import Loader
+import Profiling
+
+
+class Router:
+    """
+    Answers (start, finish, HH:MM) journey queries. It holds a single graph and applies each line's speed profile at
+    the time the train leaves each station. The planner windows, the batch runner and the HTTP server all route
+    through one, so they give the same journeys.
+
+    'startup' holds the time spent loading the network and building the graph, as the 'load' and 'build' phases.
+    """
+    # Routes are planned over (station, line) states, so changing lines takes time and the walks between nearby
+    # stations can be part of a journey.
+    engine = "interchange"
+
+    def __init__(self, path="London Underground Data.xlsx", profiles_path="Speed Profiles.csv",
+                 transfers_path="Walking Transfers.csv"):
+        self.startup = Profiling.QueryStats()
+        with self.startup.phase("load"):
+            network = Loader.load_network(path)
+            # The speed profiles (such as the faster Bakerloo line during the day) are applied at the time the train
+            # leaves each station, so one set of edges covers every time of day.
+            profiles = Loader.load_speed_profiles(profiles_path)
+            transfers = Loader.load_transfers(transfers_path)
+        with self.startup.phase("build"):
+            self.graph = Alg.Graph(network.edges, network.nodes, profiles)
+            self.graph.precompute_interchanges(transfers=transfers)
+
+    def route(self, start, finish, time, stats=None):
+        # Returns the journey as a dictionary, or one with an 'error' message if the query isn't valid.
+        query = {"start": start, "finish": finish, "time": time}
+        departure = self.departure(time)
+        if departure is None:
+            return dict(query, error="Invalid time parameters.")
+        return dict(query, **self.journey(start, finish, departure, stats))
+
+    @staticmethod
+    def departure(time):
+        # Returns 'HH:MM' as minutes after midnight, or None if it isn't a valid time. 'isdecimal' only accepts the
+        # digits 'int' can read ('isnumeric' would also let through the likes of '½').
+        hour, _, minute = str(time).partition(":")
+        if not (hour.isdecimal() and minute.isdecimal() and 0 <= int(hour) <= 24 and 0 <= int(minute) < 60):
+            return None
+        return int(hour) * 60 + int(minute)
+
+    def journey(self, start, finish, departure, stats=None):
+        # Returns the path, the total time on arriving at each station, the line taken to each station and the total.
+        # A 'Profiling.QueryStats' given as 'stats' is passed on to 'Graph.dijkstra' to be filled in.
+        if start not in self.graph.station_ids or finish not in self.graph.station_ids:
+            return {"error": "Unknown station."}
+        shortest_path, stepped_dist, stepped_line, distance = self.graph.dijkstra(start, finish, engine=self.engine,
+                                                                                  departure=departure, stats=stats)
+        if distance == float("inf"):
+            return {"error": "No route between these stations."}
+        return {"path": shortest_path, "times": stepped_dist, "lines": stepped_line, "total": distance}
+
+
+def read_queries(source, file_format):
+    # Yields (start, finish, time) tuples from a CSV or JSONL stream, one query per line. A CSV header row is skipped.
+    # A JSONL line that isn't a JSON object yields the error to write out in its place instead, so the run carries on.
+    if file_format == "jsonl":
+        for number, line in enumerate(source, 1):
+            if line.strip():
+                try:
+                    query = json.loads(line)
+                except ValueError:
+                    yield {"line": number, "error": "Not valid JSON."}
+                    continue
+                if not isinstance(query, dict):
+                    yield {"line": number, "error": "Not a JSON object."}
+                    continue
+                fields = query.get("start"), query.get("finish"), query.get("time")
+                if not all(field is None or isinstance(field, str) for field in fields):
+                    yield {"line": number, "error": "'start', 'finish' and 'time' must be strings."}
+                    continue
+                yield fields
+    else:
+        for row in csv.reader(source):
+            if row and [cell.strip().lower() for cell in row[:3]] != ["start", "finish", "time"]:
+                yield tuple(cell.strip() for cell in (row + ["", "", ""])[:3])
+
+
+# Each worker process builds its own router once, then answers chunks of queries with it. If profiling is on, the
+# worker's profiler collects the stats for each chunk until they are handed back with its answers.
+_worker_router = None
+_worker_profiler = None
+
+
+def _start_worker(path, profiles_path, transfers_path, profile=False):
+    global _worker_router, _worker_profiler
+    _worker_router = Router(path, profiles_path, transfers_path)
+    _worker_profiler = Profiling.Profiler(profile)
+    if profile:
+        _worker_profiler.record(_worker_router.startup)
+
+
+def _answer(query, stats=None):
+    # A query that couldn't be read is already its error result.
+    if isinstance(query, dict):
+        return query
+    return _worker_router.route(*query, stats=stats)
+
+
+def _answer_chunk(queries):
+    # The results are turned into JSON in the worker so the main process only has to write them out. Returns the JSON
+    # lines and the profiler's samples for the chunk (None when profiling is off).
+    if not _worker_profiler.enabled:
+        return [json.dumps(_answer(query)) for query in queries], None
+    lines = []
+    for query in queries:
+        stats = _worker_profiler.query()
+        journey = _answer(query, stats)
+        with stats.phase("serialise"):
+            lines.append(json.dumps(journey))
+        _worker_profiler.record(stats)
+    samples = _worker_profiler.samples()
+    _worker_profiler.reset()
+    return lines, samples
+
+
+def route_all(queries, path="London Underground Data.xlsx", profiles_path="Speed Profiles.csv", workers=None,
+              chunk_size=500, profiler=None, transfers_path="Walking Transfers.csv"):
+    """
+    Yields a JSON line for each query, in the same order as the queries. The queries are read lazily and only a few
+    chunks per worker are in flight at once, so the input can be far bigger than memory.
+
+    If a 'Profiling.Profiler' is given, every worker's startup and every query's phases and counters are merged into it.
+    """
+    queries = iter(queries)
+    workers = workers or os.cpu_count() or 1
+    profile = profiler is not None
+    if workers == 1:
+        _start_worker(path, profiles_path, transfers_path, profile)
+        while True:
+            chunk = list(islice(queries, chunk_size))
+            if not chunk:
+                return
+            lines, samples = _answer_chunk(chunk)
+            if profile:
+                profiler.merge(samples)
+            yield from lines
+    # Only imported when there are workers to start, as it loads 'multiprocessing', which the planner windows (which
+    # share 'Router') shouldn't have to wait for.
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(workers, initializer=_start_worker,
+                             initargs=(path, profiles_path, transfers_path, profile)) as pool:
+        pending = deque()
+        while True:
+            # Keeps every worker busy, then waits for the oldest chunk so the output stays in input order.
+            while len(pending) < workers * 2:
+                chunk = list(islice(queries, chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.submit(_answer_chunk, chunk))
+            if not pending:
+                return
+            lines, samples = pending.popleft().result()
+            if profile:
+                profiler.merge(samples)
+            yield from lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answers a stream of (start, finish, HH:MM) journey queries and "
+                                                 "writes the routes out as JSON lines, in the same order.")
+    parser.add_argument("input", nargs="?", default="-", help="CSV or JSONL file of queries, or '-' for stdin.")
+    parser.add_argument("-o", "--output", default="-", help="File to write the JSON lines to, or '-' for stdout.")
+    parser.add_argument("-f", "--format", choices=("csv", "jsonl"), help="Input format (default: from the extension).")
+    parser.add_argument("-d", "--data", default="London Underground Data.xlsx", help="The network spreadsheet.")
+    parser.add_argument("-s", "--profiles", default="Speed Profiles.csv", help="The line speed profiles table.")
+    parser.add_argument("-t", "--transfers", default="Walking Transfers.csv", help="The walking transfers table.")
+    parser.add_argument("-w", "--workers", type=int, help="Number of worker processes (default: all CPUs).")
+    parser.add_argument("-c", "--chunk-size", type=int, default=500, help="Queries sent to a worker at a time.")
+    parser.add_argument("--profile", help="Write each phase's timings and the search counters to this JSON file.")
+    parser.add_argument("--cprofile", help="Write a cProfile capture to this file. The queries are then answered in "
+                                           "this process, as cProfile can't see into the workers.")
+    args = parser.parse_args(argv)
+
+    file_format = args.format or ("jsonl" if args.input.endswith((".jsonl", ".json")) else "csv")
+    source = sys.stdin if args.input == "-" else open(args.input, newline="")
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    profiler = Profiling.Profiler() if args.profile else None
+    workers = 1 if args.cprofile else args.workers
+    try:
+        with Profiling.capture(args.cprofile) if args.cprofile else nullcontext():
+            for line in route_all(read_queries(source, file_format), args.data, args.profiles, workers,
+                                  args.chunk_size, profiler, args.transfers):
+                output.write(line + "\n")
+        if profiler is not None:
+            profiler.dump_json(args.profile)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
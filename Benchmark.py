@@ -0,0 +1,234 @@
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import Algorithms as Alg
+import Loader
+import Profiling
+
+
+def generate_network(stations, seed=0):
+    """
+    Generates a synthetic tube-like network with the same (line, station) node rows and (line, start, end, weight)
+    edge rows as the spreadsheet. Each line is a gently curving walk across a unit square that branches off a station
+    of an earlier line, so the network is always connected. Stopping next to another line's station makes it an
+    interchange. Weights are whole minutes, proportional to the distance between stops.
+    """
+    rng = random.Random(seed)
+    step = 1.5 / math.sqrt(stations)
+    radius = step * 0.2
+    stops_per_line = max(5, round(math.sqrt(stations) * 2))
+    position = []
+    # A spatial hash of the stations, in cells the size of the interchange radius.
+    cells = {}
+    nodes = []
+    edges = []
+
+    def nearby(x, y):
+        cell_x, cell_y = int(x / radius), int(y / radius)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for station in cells.get((cell_x + dx, cell_y + dy), ()):
+                    if math.dist(position[station], (x, y)) <= radius:
+                        return station
+        return None
+
+    def add_station(x, y):
+        position.append((x, y))
+        cells.setdefault((int(x / radius), int(y / radius)), []).append(len(position) - 1)
+        return len(position) - 1
+
+    line_number = 0
+    while len(position) < stations:
+        line_number += 1
+        line = "Line %d" % line_number
+        origin = rng.choice(range(len(position))) if position else add_station(rng.random(), rng.random())
+        heading = rng.random() * 2 * math.pi
+        route = [origin]
+        on_route = {origin}
+        # Walks away from the origin in both directions, so the branch point ends up part way along the line.
+        for direction in (0, math.pi):
+            x, y = position[origin]
+            angle = heading + direction
+            walk = []
+            for _ in range(stops_per_line // 2):
+                angle += rng.gauss(0, 0.3)
+                x, y = x + step * math.cos(angle), y + step * math.sin(angle)
+                # Turns back into the square at the edges.
+                if not (0 <= x <= 1 and 0 <= y <= 1):
+                    angle += math.pi
+                    x, y = min(1.0, max(0.0, x)), min(1.0, max(0.0, y))
+                station = nearby(x, y)
+                if station is None:
+                    if len(position) >= stations:
+                        break
+                    station = add_station(x, y)
+                if station not in on_route:
+                    on_route.add(station)
+                    walk.append(station)
+            route = walk[::-1] + route if direction else route + walk
+        if len(route) < 2:
+            continue
+        nodes.extend((line, "Station %06d" % station) for station in route)
+        for start, end in zip(route, route[1:]):
+            minutes = max(1, round(math.dist(position[start], position[end]) / step * 2.5))
+            edges.append((line, "Station %06d" % start, "Station %06d" % end, float(minutes)))
+    return nodes, edges
+
+
+def measure_memory(function):
+    # Returns the most memory held at once while 'function' runs, in bytes.
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+# The one-off preprocessing step of each engine that has one.
+PREPROCESSING = {"alt": lambda graph: graph.precompute_landmarks(),
+                 "matrix": lambda graph: graph.precompute_all_pairs(workers=1),
+                 "hierarchy": lambda graph: graph.precompute_hierarchy(),
+                 "interchange": lambda graph: graph.precompute_interchanges()}
+
+# The mean time the real network should take to find the quickest route and its alternatives, in milliseconds. A
+# journey planner asks for them on every search, so they should stay well within what a user notices.
+ALTERNATIVES_TARGET_MS = {"london": 10}
+
+
+def run_case(name, nodes, edges, engines, queries, seed=0, alternatives=3):
+    """
+    Benchmarks one network: building the graph, then for each engine its preprocessing, single query latency, a
+    batch of queries back to back and the memory a query needs, and finally the latency of finding 'alternatives'
+    routes per query with 'Graph.alternatives' (skipped if it is 0). Returns a list of result dictionaries.
+    """
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    graph = Alg.Graph(edges, nodes)
+    build_seconds = time.perf_counter() - start
+    graph_bytes = measure_memory(lambda: Alg.Graph(edges, nodes))
+    pairs = [(rng.choice(graph.stations), rng.choice(graph.stations)) for _ in range(queries)]
+    base = {"case": name, "stations": len(graph.stations), "edges": len(graph.edges)}
+    results = [dict(base, engine=None, build_seconds=build_seconds, graph_bytes=graph_bytes)]
+    for engine in engines:
+        # Some engines have a one-off preprocessing step, timed separately from the queries. Tracing the memory slows
+        # it down, so it is timed on its own first and run again to measure the memory.
+        preprocess = PREPROCESSING.get(engine)
+        preprocess_seconds = preprocess_bytes = 0
+        if preprocess is not None:
+            start = time.perf_counter()
+            preprocess(graph)
+            preprocess_seconds = time.perf_counter() - start
+            preprocess_bytes = measure_memory(lambda: preprocess(graph))
+        latencies = []
+        profiler = Profiling.Profiler()
+        for first, second in pairs:
+            stats = profiler.query()
+            began = time.perf_counter()
+            graph.dijkstra(first, second, engine=engine, stats=stats)
+            latencies.append(time.perf_counter() - began)
+            profiler.record(stats)
+        counters = profiler.summary()["counters"]
+        began = time.perf_counter()
+        for first, second in pairs:
+            graph.dijkstra(first, second, engine=engine)
+        batch_seconds = time.perf_counter() - began
+        query_bytes = max(measure_memory(lambda: graph.dijkstra(first, second, engine=engine))
+                          for first, second in pairs[:5])
+        results.append(dict(base, engine=engine, preprocess_seconds=preprocess_seconds,
+                            preprocess_bytes=preprocess_bytes, queries=len(pairs),
+                            mean_ms=sum(latencies) / len(latencies) * 1000,
+                            p50_ms=Profiling.percentile(latencies, 0.5) * 1000,
+                            p99_ms=Profiling.percentile(latencies, 0.99) * 1000,
+                            batch_queries_per_second=len(pairs) / batch_seconds,
+                            mean_settled=counters["settled"]["mean"], mean_relaxed=counters["relaxed"]["mean"],
+                            mean_pushes=counters["pushes"]["mean"], query_bytes=query_bytes))
+    if alternatives:
+        latencies = []
+        routes = 0
+        for first, second in pairs:
+            began = time.perf_counter()
+            routes += len(graph.alternatives(first, second, k=alternatives))
+            latencies.append(time.perf_counter() - began)
+        mean_ms = sum(latencies) / len(latencies) * 1000
+        row = dict(base, engine="alternatives-k%d" % alternatives, queries=len(pairs), mean_ms=mean_ms,
+                   p50_ms=Profiling.percentile(latencies, 0.5) * 1000,
+                   p99_ms=Profiling.percentile(latencies, 0.99) * 1000,
+                   mean_routes=routes / len(pairs))
+        # The target is for three routes, so it isn't checked for any other number.
+        if alternatives == 3 and name in ALTERNATIVES_TARGET_MS:
+            row.update(target_ms=ALTERNATIVES_TARGET_MS[name], meets_target=mean_ms <= ALTERNATIVES_TARGET_MS[name])
+        results.append(row)
+    return results
+
+
+def engines_for(stations, requested):
+    # The 'linear' engine and the all-pairs matrices grow with the square of the station count, so they're skipped
+    # on the bigger networks. Building a contraction hierarchy takes about 10 seconds at 10,000 stations and grows
+    # faster than the network does, so it's skipped above that.
+    return [engine for engine in requested if (stations <= 2000 or engine not in ("linear", "matrix"))
+            and (stations <= 10000 or engine != "hierarchy")]
+
+
+def compare(results, baseline):
+    # Prints how each timing changed against an earlier results file - above 1.0 means slower. It goes to stderr, so
+    # the JSON report on stdout can still be piped on.
+    previous = {(row["case"], row["engine"]): row for row in baseline["results"]}
+    for row in results:
+        old = previous.get((row["case"], row["engine"]))
+        if old is None:
+            continue
+        for metric in ("build_seconds", "preprocess_seconds", "mean_ms", "p99_ms"):
+            if old.get(metric) and metric in row:
+                print("%-14s %-14s %-20s %8.2fx" % (row["case"], row["engine"], metric, row[metric] / old[metric]),
+                      file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the routing engines on the real network and on "
+                                                 "generated networks of increasing size.")
+    parser.add_argument("-s", "--sizes", default="100,1000,10000,100000",
+                        help="Comma separated station counts of the generated networks.")
+    parser.add_argument("-e", "--engines", default="heap,bucket,bidirectional,alt,hierarchy,interchange,linear,matrix",
+                        help="Comma separated engines to benchmark.")
+    parser.add_argument("-q", "--queries", type=int, default=50, help="Random queries per network and engine.")
+    parser.add_argument("-k", "--alternatives", type=int, default=3,
+                        help="Routes to find per query when timing 'Graph.alternatives' (0 to skip it).")
+    parser.add_argument("-d", "--data", default="London Underground Data.xlsx", help="The real network spreadsheet.")
+    parser.add_argument("-o", "--output", help="File to write the JSON results to (default: stdout).")
+    parser.add_argument("-c", "--compare", help="Earlier JSON results to compare the timings against.")
+    args = parser.parse_args(argv)
+    engines = args.engines.split(",")
+
+    # The real network is always run first, as a fixed baseline.
+    network = Loader.load_network(args.data)
+    cases = [("london", network.nodes, network.edges)]
+    for size in (int(size) for size in args.sizes.split(",") if size):
+        cases.append(("synthetic-%d" % size,) + generate_network(size))
+    results = []
+    for name, nodes, edges in cases:
+        results.extend(run_case(name, nodes, edges, engines_for(len(set(n[1] for n in nodes)), engines),
+                                args.queries, alternatives=args.alternatives))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {"commit": commit, "python": platform.python_version(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "results": results}
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == '__main__':
+    main()
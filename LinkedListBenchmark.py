@@ -0,0 +1,96 @@
+from DoublyLinkedList import DoublyLinkedList as DDList
+import argparse
+import random
+import time
+import tracemalloc
+import Algorithms as Alg
+import Loader
+
+
+def copied_trace_path(graph, finish_id, distance, previous, via_line):
+    # The path reconstruction as it was before, building linked lists and copying each one out with 'traverse_all'.
+    shortest_path = DDList()
+    stepped_dist = DDList()
+    stepped_line = DDList()
+    shortest_path.add_last(graph.stations[finish_id])
+    stepped_dist.add_last(distance[finish_id])
+    stepped_line.add_last(via_line[finish_id])
+    current_prev = previous[finish_id]
+    while current_prev is not None:
+        shortest_path.add_first(graph.stations[current_prev])
+        stepped_dist.add_first(distance[current_prev])
+        if via_line[current_prev] is not None:
+            stepped_line.add_first(via_line[current_prev])
+        else:
+            stepped_line.add_first(stepped_line.get_head())
+        current_prev = previous[current_prev]
+    return shortest_path.traverse_all(), stepped_dist.traverse_all(), stepped_line.traverse_all(), distance[finish_id]
+
+
+def copied_scan(neighbour_lists):
+    # Visits every neighbour of every station by copying each list first, like 'return_neighbours' used to.
+    for neighbours in neighbour_lists:
+        for _ in neighbours.traverse_all():
+            pass
+
+
+def lazy_scan(neighbour_lists):
+    # Visits every neighbour of every station by iterating over the lists in place.
+    for neighbours in neighbour_lists:
+        for _ in neighbours:
+            pass
+
+
+def measure(query, queries):
+    # Returns the average time per query in microseconds and the average peak memory allocated during a query.
+    start = time.perf_counter()
+    for arguments in queries:
+        query(*arguments)
+    elapsed = (time.perf_counter() - start) / len(queries) * 1e6
+    peaks = 0
+    tracemalloc.start()
+    for arguments in queries:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        query(*arguments)
+        peaks += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return elapsed, peaks / len(queries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compares copying the linked lists with 'traverse_all' against "
+                                                 "iterating over them in place, per route query.")
+    parser.add_argument("-n", "--queries", type=int, default=500, help="Number of random route queries.")
+    parser.add_argument("-d", "--data", default="London Underground Data.xlsx", help="The network spreadsheet.")
+    args = parser.parse_args(argv)
+
+    network = Loader.load_network(args.data)
+    graph = Alg.Graph(network.edges, network.nodes)
+    # Runs the searches up front so only the parts that used the linked lists are timed.
+    queries = []
+    for _ in range(args.queries):
+        start, finish = random.randrange(len(graph.stations)), random.randrange(len(graph.stations))
+        queries.append((finish, *graph._search_heap(start, finish)[:3]))
+    # One linked list of neighbours per station, the way 'Station' stores them.
+    neighbour_lists = []
+    for neighbours in graph.adjacency:
+        linked = DDList()
+        for neighbour in neighbours:
+            linked.add_last(neighbour)
+        neighbour_lists.append(linked)
+
+    cases = (
+        ("path reconstruction - linked lists + traverse_all",
+         lambda *state: copied_trace_path(graph, *state)),
+        ("path reconstruction - plain lists", graph._trace_path),
+        ("neighbour scan - traverse_all", lambda *state: copied_scan(neighbour_lists)),
+        ("neighbour scan - lazy __iter__", lambda *state: lazy_scan(neighbour_lists)),
+    )
+    print("%-52s %12s %14s" % ("Per query", "Time (us)", "Peak (bytes)"))
+    for name, query in cases:
+        print("%-52s %12.1f %14.0f" % ((name,) + measure(query, queries)))
+
+
+if __name__ == '__main__':
+    main()
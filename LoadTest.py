@@ -0,0 +1,65 @@
+from urllib.parse import urlencode
+import argparse
+import asyncio
+import json
+import random
+import time
+import Loader
+import Profiling
+
+
+async def client(host, port, queries, latencies):
+    # Sends its share of the queries one after another over a single keep-alive connection.
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for start, finish, clock in queries:
+            target = "/route?" + urlencode({"from": start, "to": finish, "time": clock})
+            sent = time.perf_counter()
+            writer.write(("GET %s HTTP/1.1\r\nHost: %s\r\n\r\n" % (target, host)).encode("latin-1"))
+            await writer.drain()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - sent)
+    finally:
+        writer.close()
+
+
+async def run(host, port, requests, concurrency, stations, repeat):
+    # Draws the queries from a pool of 'repeat' distinct ones, so the share of cache hits can be controlled.
+    pool = [(random.choice(stations), random.choice(stations), "%02d:%02d" % (random.randint(0, 23),
+                                                                          random.randint(0, 59)))
+            for _ in range(repeat)]
+    queries = [random.choice(pool) for _ in range(requests)]
+    latencies = []
+    began = time.perf_counter()
+    await asyncio.gather(*(client(host, port, queries[i::concurrency], latencies) for i in range(concurrency)))
+    elapsed = time.perf_counter() - began
+    return {"requests": len(latencies), "seconds": elapsed, "requests_per_second": len(latencies) / elapsed,
+            "p50_ms": Profiling.percentile(latencies, 0.50) * 1000,
+            "p99_ms": Profiling.percentile(latencies, 0.99) * 1000,
+            "max_ms": max(latencies) * 1000}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures the throughput and latency of a running Server.py.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8080)
+    parser.add_argument("-n", "--requests", type=int, default=10000, help="Total number of requests to send.")
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="Number of connections to use.")
+    parser.add_argument("-r", "--repeat", type=int, default=2000, help="Number of distinct queries to draw from.")
+    parser.add_argument("-d", "--data", default="London Underground Data.xlsx", help="The network spreadsheet.")
+    args = parser.parse_args(argv)
+    stations = sorted(set(station for line, station in Loader.load_network(args.data).nodes))
+    print(json.dumps(asyncio.run(run(args.host, args.port, args.requests, args.concurrency, stations,
+                                     args.repeat)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
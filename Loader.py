@@ -0,0 +1,206 @@
+import csv
+import hashlib
+import json
+import mmap
+import os
+import sys
+import tempfile
+
+
+class Network:
+    """
+    Holds the parsed London Underground network - the node and edge records that 'Algorithms.Graph' reads, plus the
+    station and line tables and the raw integer/float arrays they were rebuilt from.
+
+    When loaded from a snapshot, the arrays are read-only views straight onto the memory-mapped file.
+    """
+    def __init__(self, stations, lines, node_line, node_station, edge_line, edge_start, edge_end, edge_weight):
+        self.stations = stations
+        self.lines = lines
+        self.node_line = node_line
+        self.node_station = node_station
+        self.edge_line = edge_line
+        self.edge_start = edge_start
+        self.edge_end = edge_end
+        self.edge_weight = edge_weight
+        # Rebuilds the records in the same (line, station) and (line, start, end, weight) layout as the spreadsheet.
+        self.nodes = [(lines[line], stations[station]) for line, station in zip(node_line, node_station)]
+        self.edges = [(lines[line], stations[start], stations[end], weight)
+                      for line, start, end, weight in zip(edge_line, edge_start, edge_end, edge_weight)]
+
+    @classmethod
+    def from_records(cls, nodes, edges):
+        # Gives every station and line an integer ID and turns the records into arrays of those IDs.
+        stations = list(dict.fromkeys([n[1] for n in nodes] + [e[1] for e in edges] + [e[2] for e in edges]))
+        lines = list(dict.fromkeys([n[0] for n in nodes] + [e[0] for e in edges]))
+        station_ids = {station: index for index, station in enumerate(stations)}
+        line_ids = {line: index for index, line in enumerate(lines)}
+        return cls(stations, lines,
+                   [line_ids[n[0]] for n in nodes], [station_ids[n[1]] for n in nodes],
+                   [line_ids[e[0]] for e in edges], [station_ids[e[1]] for e in edges],
+                   [station_ids[e[2]] for e in edges], [float(e[3]) for e in edges])
+
+
+# Snapshot layout: the magic bytes, a 4 byte header length, a JSON header with the station/line tables and the source
+# file's key, then the arrays one after the other, each starting on an 8 byte boundary.
+SNAPSHOT_MAGIC = b"LURPNET\0"
+SNAPSHOT_VERSION = 1
+# The arrays stored in a snapshot, in order, with their 'array'/'memoryview' type codes.
+SNAPSHOT_ARRAYS = (("node_line", "i"), ("node_station", "i"), ("edge_line", "i"), ("edge_start", "i"),
+                   ("edge_end", "i"), ("edge_weight", "d"))
+
+# Networks already loaded by this process, keyed on the source path and its modification time.
+_loaded = {}
+
+
+def load_network(path="London Underground Data.xlsx", snapshot_path=None):
+    """
+    Returns the network stored in the workbook at 'path'. The first load parses the workbook and writes a binary
+    snapshot next to it; later loads (and new windows in the same process) read the snapshot instead.
+    """
+    snapshot_path = snapshot_path or os.path.splitext(path)[0] + ".snapshot"
+    mtime = os.stat(path).st_mtime_ns
+    if (path, mtime) in _loaded:
+        return _loaded[(path, mtime)]
+    network = read_snapshot(snapshot_path, path)
+    if network is None:
+        network = Network.from_records(*parse_workbook(path))
+        try:
+            write_snapshot(snapshot_path, network, path)
+        except OSError:
+            # The snapshot is only a cache, so the network is still usable if it can't be written.
+            pass
+    _loaded[(path, mtime)] = network
+    return network
+
+
+def load_speed_profiles(path="Speed Profiles.csv"):
+    """
+    Reads the line speed profiles table. Each row gives a line, the HH:MM it starts and stops applying (24:00 is
+    midnight) and the factor that line's times are multiplied by in between. Returns a dictionary of each line's
+    (from minute, until minute, factor) periods.
+    """
+    profiles = {}
+    with open(path, newline="") as table:
+        for row in csv.DictReader(table):
+            periods = profiles.setdefault(row["Line"].strip(), [])
+            minutes = []
+            for column in ("From", "Until"):
+                hour, _, minute = row[column].strip().partition(":")
+                if not (hour.isnumeric() and minute.isnumeric() and int(hour) <= 24 and int(minute) < 60):
+                    raise ValueError(row[column], " is not a valid HH:MM time.")
+                minutes.append(int(hour) * 60 + int(minute))
+            if float(row["Factor"]) <= 0:
+                raise ValueError(row["Factor"], " is not a valid speed factor.")
+            periods.append((minutes[0], minutes[1], float(row["Factor"])))
+    return profiles
+
+
+def load_transfers(path="Walking Transfers.csv"):
+    """
+    Reads the walking transfers table. Each row gives two nearby stations and the minutes it takes to walk between
+    them. Returns a list of (station, station, minutes) walks, as 'Graph.precompute_interchanges' takes them.
+    """
+    transfers = []
+    with open(path, newline="") as table:
+        for row in csv.DictReader(table):
+            if float(row["Minutes"]) <= 0:
+                raise ValueError(row["Minutes"], " is not a valid walking time.")
+            transfers.append((row["From"].strip(), row["To"].strip(), float(row["Minutes"])))
+    return transfers
+
+
+def parse_workbook(path):
+    # pandas (and openpyxl underneath it) are only needed when there is no usable snapshot.
+    import pandas as pd
+    df = pd.DataFrame(pd.read_excel(path, header=None))
+    # Removes any empty/white spaces before and after an entry to reduce errors.
+    for i in range(len(df.columns) - 1):
+        df[i] = df[i].str.strip()
+    # If the 'Time' column is null, then that row is a node and any null cells are dropped.
+    df_nodes = df[pd.isna(df[3])].dropna(axis=1, how="all")
+    # Anything that has a value in the 'Time' (fourth) column is an edge.
+    df_edges = df[df[3] > 0]
+    nodes = [(line, station) for line, station in df_nodes.itertuples(index=False)]
+    edges = [(line, start, end, float(weight)) for line, start, end, weight in df_edges.itertuples(index=False)]
+    return nodes, edges
+
+
+def source_key(path):
+    # A snapshot is only valid for the exact file it was built from - identified by its hash and modification time.
+    with open(path, "rb") as source:
+        digest = hashlib.sha256(source.read()).hexdigest()
+    return {"sha256": digest, "mtime": os.stat(path).st_mtime_ns}
+
+
+def write_snapshot(snapshot_path, network, source_path):
+    from array import array
+    header = {"version": SNAPSHOT_VERSION, "byteorder": sys.byteorder, "source": source_key(source_path),
+              "stations": network.stations, "lines": network.lines,
+              "counts": [len(getattr(network, name)) for name, _ in SNAPSHOT_ARRAYS]}
+    header = json.dumps(header).encode("utf-8")
+    # Writes to a temporary file of its own first so a half-written snapshot is never picked up, even when several
+    # processes (such as the batch workers) rebuild a missing snapshot at the same time.
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(snapshot_path)), suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as snapshot:
+            snapshot.write(SNAPSHOT_MAGIC + len(header).to_bytes(4, "little") + header)
+            for name, code in SNAPSHOT_ARRAYS:
+                snapshot.write(b"\0" * (-snapshot.tell() % 8))
+                snapshot.write(array(code, getattr(network, name)).tobytes())
+        os.replace(temp_path, snapshot_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_snapshot(snapshot_path, source_path):
+    """
+    Returns the network stored in the snapshot, or None if there isn't one, it's out of date with the source file or it
+    is damaged (cut short, or with counts that don't match its arrays), so the caller rebuilds it.
+    """
+    try:
+        with open(snapshot_path, "rb") as snapshot:
+            data = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        return None
+    offset = len(SNAPSHOT_MAGIC) + 4
+    header_length = int.from_bytes(data[len(SNAPSHOT_MAGIC):offset], "little")
+    try:
+        header = json.loads(data[offset:offset + header_length].decode("utf-8"))
+    except ValueError:
+        return None
+    if not isinstance(header, dict) or header.get("version") != SNAPSHOT_VERSION \
+            or header.get("byteorder") != sys.byteorder:
+        return None
+    # The modification time is checked first, so the source file only has to be hashed if it has been touched.
+    source = header.get("source", {})
+    if source.get("mtime") != os.stat(source_path).st_mtime_ns:
+        if source.get("sha256") != source_key(source_path)["sha256"]:
+            return None
+    # The node arrays and the edge arrays come in sets of the same length, and together they must fill the rest of the
+    # file exactly.
+    counts = header.get("counts")
+    if not (isinstance(counts, list) and len(counts) == len(SNAPSHOT_ARRAYS)
+            and all(isinstance(count, int) and count >= 0 for count in counts)
+            and counts[0] == counts[1] and counts[2] == counts[3] == counts[4] == counts[5]):
+        return None
+    offset += header_length
+    view = memoryview(data)
+    arrays = {}
+    for (name, code), count in zip(SNAPSHOT_ARRAYS, counts):
+        offset += -offset % 8
+        size = count * (4 if code == "i" else 8)
+        if offset + size > len(data):
+            return None
+        arrays[name] = view[offset:offset + size].cast(code)
+        offset += size
+    if offset != len(data):
+        return None
+    try:
+        return Network(header["stations"], header["lines"], **arrays)
+    except (KeyError, IndexError, TypeError):
+        # The arrays point at stations or lines that aren't in the tables.
+        return None
@@ -1,20 +1,97 @@
 from tkinter import *
 from tkinter import ttk
+from bisect import bisect_left
 from itertools import groupby
 import tkinter.messagebox as mb
-import pandas as pd
+import argparse
 import Algorithms as Alg
-import time
-import matplotlib.pyplot
-closed_station = ""
-start = time.time()
+import Batch
 
-print(23*2.3)
 
-end = time.time()
-print(end - start)
+# The router is built the first time a window needs it and then shared, so going 'Back' from the results is instant.
+_routing = {}
 
 
+def load_routing(path="London Underground Data.xlsx", profiles_path="Speed Profiles.csv",
+                 transfers_path="Walking Transfers.csv"):
+    """
+    Returns the 'Batch.Router' for the network, the same one the batch runner and the HTTP server use, so the windows
+    show the same journeys they give. The network comes from its binary snapshot and the excel document is only read
+    again when it has changed. Nothing here needs tkinter, pandas or matplotlib.
+    """
+    key = (path, profiles_path, transfers_path)
+    if key not in _routing:
+        _routing[key] = Batch.Router(path, profiles_path, transfers_path)
+    return _routing[key]
+
+
+# Loading the network and searching run on this thread so the windows keep responding. There is only one, so the graph
+# is never used by two searches at once, and the windows poll for the results with 'after' as tkinter isn't thread-safe.
+# It is started by the first window that needs it, so importing this module starts nothing.
+_worker = None
+# How often a window checks whether the worker has finished, in milliseconds.
+POLL_MS = 50
+# The most stations suggested while a name is being typed. With nothing typed, every station is listed.
+MAX_SUGGESTIONS = 100
+
+
+class StationIndex:
+    """
+    A prefix index of the station names for checking and completing them as they are typed, ignoring case. Each name
+    is kept once for every word in it, sorted by the rest of the name from that word on, so the stations with a word
+    starting with what has been typed ('cross' finds "King's Cross St. Pancras") are one slice found by bisection,
+    however many stations there are.
+    """
+    def __init__(self, names):
+        self.names = sorted(set(names))
+        self.exact = {name.casefold(): name for name in self.names}
+        entries = []
+        for name in self.names:
+            folded = name.casefold()
+            entries.extend((folded[i:], name) for i in range(len(folded))
+                           if folded[i] != " " and (i == 0 or folded[i - 1] == " "))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.entries = [name for _, name in entries]
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, text):
+        # Returns the station named 'text', however it is capitalised, or None if there isn't one.
+        return self.exact.get(text.strip().casefold())
+
+    def complete(self, text, limit=MAX_SUGGESTIONS):
+        # Returns the stations with a word starting with 'text', those whose name starts with it first, or every station
+        # if 'text' is empty.
+        prefix = text.strip().casefold()
+        if not prefix:
+            return self.names
+        # Every key starting with the prefix sorts before the prefix with its last character moved on by one.
+        matches = set(self.entries[bisect_left(self.keys, prefix):
+                                   bisect_left(self.keys, prefix[:-1] + chr(ord(prefix[-1]) + 1))])
+        return sorted(matches, key=lambda name: (not name.casefold().startswith(prefix), name))[:limit]
+
+
+def routing_worker():
+    # Returns the worker thread's executor, starting it the first time.
+    global _worker
+    if _worker is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="routing")
+    return _worker
+
+
+def show_stats(graph):
+    # Opt-in diagnostics: a histogram of the travel times between stations. matplotlib is slow to import, so it is only
+    # loaded here, and the figure doesn't block so the planner window still opens straight away.
+    import matplotlib.pyplot as plt
+    plt.figure("Travel Times Between Stations")
+    plt.hist([edge.weight for edge in graph.edges], bins=range(0, int(max(edge.weight for edge in graph.edges)) + 2))
+    plt.xlabel("Minutes")
+    plt.ylabel("Edges")
+    plt.show(block=False)
+
 
 class MainWindow:
     """
@@ -23,7 +100,7 @@ class MainWindow:
     'MainWindow' contains the initial window. The user can select their starting and finishing station as well as the
     time at which they wish to traverse the London Underground network.
     """
-    def __init__(self, master):
+    def __init__(self, master, stats=False):
         # Initialise the main window configurations.
         self.master = master
         self.master.title("London Underground Route Planner")
@@ -35,39 +112,23 @@ class MainWindow:
         self.label_title = Label(self.frame, text="London Underground Journey Planner", bg="azure", width="350",
                                  relief="ridge", height="6", bd=5, font=("Helvetica", 14, "italic")).pack(pady=20)
 
-        # Loads the excel document.
-        self.data = pd.read_excel("London Underground Data.xlsx", header=None)
-        self.df = pd.DataFrame(self.data)
-        self.df.plot(kind='hist')
-        matplotlib.pyplot.show()
-        # Removes any empty/white spaces before and after an entry to reduce errors.
-        for i in range(len(self.df.columns) - 1):
-            self.df[i] = self.df[i].str.strip()
-
-        # If the 'Time' column is null, then that row is added to the nodes DataFrame and any null cells are dropped.
-        self.df_nodes = self.df[pd.isna(self.df[3])].dropna(axis=1, how="all")
-        self.records_nodes = list(self.df_nodes.to_records(index=False))
-        # Creates a list of all unique values of stations and sorts them into alphabetical order.
-        self.unique_nodes = sorted(list(self.df_nodes[1].unique()))
-
-        # Checks all the rows and puts anything that has a value in the 'Time' (fourth) column into df_edges.
-        self.df_edges = self.df[self.df[3] > 0]
-        self.records_edges = list(self.df_edges.to_records(index=False))
-
-        # Updated sped up Bakerloo line for during specified times.
-        self.records_speed_edges = list(self.df_edges.to_records(index=False))
-        for edge in self.records_speed_edges:
-            if edge[0] == "Bakerloo":
-                edge[3] = edge[3] / 2
-
-        # Combo box and label for the starting and finishing station.
+        # The router and the index of the station names are filled in once the network has loaded.
+        self.router = self.stations = None
+        # The search being run on the worker and the inputs it was started with, or None.
+        self.search = None
+        # The 'after' ID of the next check on the worker, or None. It is cancelled when the window closes.
+        self.poll_id = None
+        self.master.protocol("WM_DELETE_WINDOW", self.close)
+
+        # Combo boxes and labels for the starting and finishing station. Typing in one narrows its list down to the
+        # stations that match.
+        self.start_station = StringVar()
+        self.finish_station = StringVar()
         self.label_start = Label(self.frame, text="Starting Station").pack()
-        self.input_start = ttk.Combobox(self.frame, values=self.unique_nodes, width="30",
-                                        state="readonly")
+        self.input_start = ttk.Combobox(self.frame, textvariable=self.start_station, width="30")
         self.input_start.pack(pady=10)
         self.label_finish = Label(self.frame, text="Target Station").pack()
-        self.input_finish = ttk.Combobox(self.frame, values=self.unique_nodes, width="30",
-                                         state="readonly")
+        self.input_finish = ttk.Combobox(self.frame, textvariable=self.finish_station, width="30")
         self.input_finish.pack(pady=10)
 
         # Declare input variables for time.
@@ -83,60 +144,148 @@ class MainWindow:
         self.text_min = Entry(self.frame, textvariable=self.time_min, width="15", bd=5)
         self.text_min.pack(padx=10, pady=10)
 
+        # Typing a station's name narrows down its list, and changing any of the inputs cancels a search that was
+        # started with the old ones.
+        self.start_station.trace_add("write", lambda *_: self.suggest(self.input_start))
+        self.finish_station.trace_add("write", lambda *_: self.suggest(self.input_finish))
+        for variable in (self.start_station, self.finish_station, self.time_hour, self.time_min):
+            variable.trace_add("write", self.inputs_changed)
+
         # Continue and Exit button on the front page.
         self.process_button = Button(self.frame, text="Get Directions", height="2", width="15", bd=3, bg="grey",
                                      font=("Helvetica", 12, "bold"), command=self.entry_verification).pack(pady=10)
         self.exit_button = Button(self.frame, text="EXIT", height="2", width="10", bd=3, bg="grey",
                                   font=("Helvetica", 10, "bold"), command=self.exit_window).pack()
 
+        # Shows what the worker is doing (loading the network or searching).
+        self.status = StringVar()
+        self.status_label = Label(self.frame, textvariable=self.status, bg="grey").pack(pady=10)
+
+        # Loads the network and builds the router on the worker, which only happens once per run, so the window opens
+        # straight away.
+        self.status.set("Loading the network...")
+        self.poll_loading(routing_worker().submit(load_routing), stats)
+
+    # Waits for the network to load without blocking the window, then fills in the station lists.
+    def poll_loading(self, loading, stats):
+        self.poll_id = None
+        if not loading.done():
+            self.poll_id = self.master.after(POLL_MS, self.poll_loading, loading, stats)
+            return
+        if loading.exception() is not None:
+            self.status.set("")
+            mb.showerror("Error!", "The network couldn't be loaded: " + str(loading.exception()))
+            return
+        self.router = loading.result()
+        self.stations = StationIndex(self.router.graph.stations)
+        self.suggest(self.input_start)
+        self.suggest(self.input_finish)
+        self.status.set("")
+        if stats:
+            show_stats(self.router.graph)
+
+    # Lists the stations matching what has been typed into the combo box so far.
+    def suggest(self, combobox):
+        if self.stations is not None:
+            combobox["values"] = self.stations.complete(combobox.get())
+
+    def inputs(self):
+        return self.start_station.get(), self.finish_station.get(), self.time_hour.get(), self.time_min.get()
+
+    # Cancels the search in progress if it was started with different inputs. A search that is already running can't
+    # be stopped, so its route is thrown away when it finishes instead.
+    def inputs_changed(self, *_):
+        if self.search is not None and self.search[1] != self.inputs():
+            self.search[0].cancel()
+            self.search = None
+            self.status.set("Search cancelled as the inputs changed.")
+
     # Ensures that all the entry boxes have been filled before proceeding to the algorithm and results table.
     def entry_verification(self):
-        speed_up = False
         # Checks whether the input for the hour and minutes are valid.
         if str.isnumeric(self.text_hour.get()) and str.isnumeric(self.text_min.get()):
             if 0 <= int(self.text_hour.get()) <= 24 and 0 <= int(self.text_min.get()) < 60:
-                # Updates whether we use the faster Bakerloo line times.
-                if 9 <= int(self.text_hour.get()) < 16 or 19 <= int(self.text_hour.get()) < 24:
-                    speed_up = True
-                if len(self.input_start.get()) == 0 or len(self.input_finish.get()) == 0:
+                if self.stations is None:
+                    mb.showinfo("Please Wait", "The network is still loading.")
+                elif len(self.input_start.get()) == 0 or len(self.input_finish.get()) == 0:
                     mb.showinfo("Missing Arguments", "Please ensure that all entries are filled and entered correctly.")
-                elif self.input_start.get() == self.input_finish.get():
+                elif self.stations.lookup(self.input_start.get()) is None:
+                    mb.showerror("Error!", "There is no station called '" + self.input_start.get().strip() + "'.")
+                elif self.stations.lookup(self.input_finish.get()) is None:
+                    mb.showerror("Error!", "There is no station called '" + self.input_finish.get().strip() + "'.")
+                elif self.stations.lookup(self.input_start.get()) == self.stations.lookup(self.input_finish.get()):
                     mb.showinfo("Error?", "The entries for the starting and finishing stations are both the same. "
                                           "You're already there!")
                 else:
-                    # Ensures the inputs are valid and gives the appropriate data depending on the time.
-                    if self.input_start.get() and self.input_finish.get() in self.unique_nodes:
-                        if speed_up:
-                            self.initialise_results(self.records_speed_edges)
-                        else:
-                            self.initialise_results(self.records_edges)
+                    # Passes on the stations as they are named in the network and the departure time in minutes after
+                    # midnight.
+                    self.initialise_results(self.stations.lookup(self.input_start.get()),
+                                            self.stations.lookup(self.input_finish.get()),
+                                            int(self.text_hour.get()) * 60 + int(self.text_min.get()))
             else:
                 mb.showerror("Error!", "Invalid time parameters.")
         else:
             mb.showerror("Error!", "Time MUST contain positive numeric numbers only within the specified region.")
 
-    # Calls the Dijkstra's path finding function, stores the values and parses it into the results table.
-    def initialise_results(self, graph_edges):
-        # Initialising the graph in advanced for Dijkstra's algorithm to traverse.
-        graph = Alg.Graph(graph_edges, self.records_nodes)
-        shortest_path, stepped_dist, stepped_line, distance = graph.dijkstra(self.input_start.get(),
-                                                                             self.input_finish.get())
+    # Calls the router's path finding function on the worker, then waits for the route to parse it into the results
+    # table. Its engine keeps to one line until it is worth changing, so the journey summary only lists real changes.
+    def initialise_results(self, start, finish, departure):
+        if self.search is not None:
+            self.search[0].cancel()
+        if self.poll_id is not None:
+            self.master.after_cancel(self.poll_id)
+        self.search = (routing_worker().submit(self.router.journey, start, finish, departure), self.inputs())
+        self.status.set("Searching...")
+        self.poll_search(self.search)
+
+    def poll_search(self, search):
+        self.poll_id = None
+        # Stops polling a search that has been cancelled or replaced by a newer one.
+        if search is not self.search:
+            return
+        if not search[0].done():
+            self.poll_id = self.master.after(POLL_MS, self.poll_search, search)
+            return
+        self.search = None
+        self.status.set("")
+        if search[0].exception() is not None:
+            mb.showerror("Error!", "The route couldn't be found: " + str(search[0].exception()))
+            return
+        journey = search[0].result()
+        if "error" in journey:
+            mb.showerror("Error!", journey["error"])
+            return
+        self.close()
+        Results(Tk(), journey["path"], journey["times"], journey["lines"], journey["total"],
+                self.router.graph.interchange_settings[0])
+
+    # Stops checking on the worker and drops the search in progress before the window goes, so nothing calls back
+    # into it once it has been destroyed.
+    def close(self):
+        if self.poll_id is not None:
+            self.master.after_cancel(self.poll_id)
+            self.poll_id = None
+        if self.search is not None:
+            self.search[0].cancel()
+            self.search = None
         self.master.destroy()
-        Results(Tk(), shortest_path, stepped_dist, stepped_line, distance)
 
     # Method that opens a confirmation box and then terminates the program if yes.
     def exit_window(self):
         exit_ = mb.askyesno("Exit Warning!", "Are you sure you want to quit?")
         if exit_:
-            self.master.destroy()
+            self.close()
 
 
 class Results:
     """
     Contains the shortest path between the two stations given, the total time required to travel to each station and the
     total accumulated time to travel from start to finish. The train lines required are also given.
+
+    'penalty' is the time the route allows for changing line, which the totals include but the travel times between
+    stations leave out.
     """
-    def __init__(self, master, shortest_path, stepped_dist, stepped_line, distance):
+    def __init__(self, master, shortest_path, stepped_dist, stepped_line, distance, penalty=0):
         # Initialise the results window configurations that shows up after the main window.
         self.master = master
         self.master.title("Route Planner Results")
@@ -146,10 +295,7 @@ class Results:
         self.frame.pack()
 
         # Calculates the time intervals between each station.
-        self.time_to_next = []
-        for i in range(len(stepped_dist) - 1):
-            # When calculating the travel time between stations, the 1 minute waiting time at each station is removed.
-            self.time_to_next.append((stepped_dist[i + 1] - stepped_dist[i]) - 1)
+        self.time_to_next = self.travel_times(stepped_dist, stepped_line, penalty)
         self.time_to_next.append('')
 
         # Creates a Treeview/Table that can display the Stations, Train Lines, Travel Time Between Stations and the
@@ -193,6 +339,24 @@ class Results:
         self.exit = Button(self.frame, text="Exit", height="2", width="5", bd=2, font=("Helvetica", 8, "bold"),
                            bg="grey", command=self.exit_window).pack(side=LEFT, fill=X, anchor=W, expand=YES)
 
+    @staticmethod
+    def travel_times(stepped_dist, stepped_line, penalty):
+        # Returns the time from each station to the next. When calculating the travel time between stations, the 1
+        # minute waiting time at each station is removed. A walk has no wait, so it shows the minutes spent walking.
+        # The penalty for changing line is added to the leg after the change, so it is taken off again there - after
+        # a change between two lines, or after a walk, unless the walk set off from the start, where there was no
+        # train to change from.
+        times = []
+        for i in range(len(stepped_dist) - 1):
+            step = stepped_dist[i + 1] - stepped_dist[i]
+            if stepped_line[i + 1] != Alg.WALK:
+                step -= 1
+            if i > 0 and ((stepped_line[i] == Alg.WALK and i > 1)
+                          or (Alg.WALK != stepped_line[i] != stepped_line[i + 1] != Alg.WALK)):
+                step -= penalty
+            times.append(step)
+        return times
+
     # Method to initialise the main window and destroy the current results table.
     def back_main(self):
         self.master.destroy()
@@ -207,6 +371,9 @@ class Results:
 
 # Initialises the main window and keeps the program running until exited.
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="London Underground route planner.")
+    parser.add_argument("--stats", action="store_true", help="Also plot the network's travel times (needs matplotlib).")
+    args = parser.parse_args()
     root = Tk()
-    MainWindow(root)
+    MainWindow(root, stats=args.stats)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,114 @@
+from contextlib import contextmanager
+import json
+import time
+
+
+class QueryStats:
+    """
+    Wall time and counters for a single query. 'phases' maps each phase (such as 'lookup', 'search' and 'trace' in
+    'Graph.dijkstra') to the seconds spent in it, and 'counters' maps names such as 'settled', 'relaxed', 'pushes' and
+    'cache_hits' to how many times each happened.
+    """
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        # Adds the time spent inside the 'with' block to the phase, so a phase can be timed in several pieces.
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def as_dict(self):
+        return {"phases": dict(self.phases), "counters": dict(self.counters)}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Profiler:
+    """
+    Collects the 'QueryStats' of many queries and summarises each phase and counter with its mean and percentiles.
+
+    Profiling is opt-in: when 'enabled' is False, 'query' returns None, which callers pass straight on as the 'stats'
+    argument, so nothing is timed or counted and the queries run exactly as they would without a profiler.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        # One list of samples per phase and per counter, in the order the queries were recorded.
+        self.phases = {}
+        self.counters = {}
+
+    def query(self):
+        # Returns a fresh 'QueryStats' to fill in for one query, or None if profiling is turned off.
+        return QueryStats() if self.enabled else None
+
+    def record(self, stats):
+        if stats is None:
+            return
+        for name, seconds in stats.phases.items():
+            self.phases.setdefault(name, []).append(seconds)
+        for name, amount in stats.counters.items():
+            self.counters.setdefault(name, []).append(amount)
+
+    def samples(self):
+        # The raw samples, as plain data that can be sent between processes and passed to 'merge'.
+        return {"phases": self.phases, "counters": self.counters}
+
+    def merge(self, samples):
+        for name, values in samples["phases"].items():
+            self.phases.setdefault(name, []).extend(values)
+        for name, values in samples["counters"].items():
+            self.counters.setdefault(name, []).extend(values)
+
+    def reset(self):
+        self.phases = {}
+        self.counters = {}
+
+    def summary(self):
+        """
+        Returns the mean, p50, p90, p99 and max of each phase in milliseconds, and the total, mean, p50, p99 and max of
+        each counter. 'count' is how many samples each one has, as a query that never reached a phase (such as a cache
+        hit, which is never searched) doesn't add a sample for it.
+        """
+        phases = {}
+        for name, values in self.phases.items():
+            phases[name] = {"count": len(values), "mean_ms": sum(values) / len(values) * 1000,
+                            "p50_ms": percentile(values, 0.5) * 1000, "p90_ms": percentile(values, 0.9) * 1000,
+                            "p99_ms": percentile(values, 0.99) * 1000, "max_ms": max(values) * 1000}
+        counters = {}
+        for name, values in self.counters.items():
+            counters[name] = {"count": len(values), "total": sum(values), "mean": sum(values) / len(values),
+                              "p50": percentile(values, 0.5), "p99": percentile(values, 0.99), "max": max(values)}
+        return {"phases": phases, "counters": counters}
+
+    def dump_json(self, path):
+        with open(path, "w") as output:
+            json.dump(self.summary(), output, indent=2)
+
+
+@contextmanager
+def capture(path):
+    """
+    Runs the 'with' block under cProfile and writes the capture to 'path', ready for 'pstats' or a viewer such as
+    snakeviz. cProfile only sees the current process.
+    """
+    import cProfile
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
@@ -0,0 +1,163 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import asyncio
+import json
+import Batch
+import Profiling
+
+
+class LRUCache:
+    """
+    A bounded least recently used cache. Once it holds 'maxsize' entries, adding another drops the one that was used
+    longest ago.
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, valid=None):
+        # Returns the cached value (and marks it as recently used), or None if it isn't cached. A value that 'valid'
+        # rejects is left in the cache but counts as a miss.
+        if key in self.entries and (valid is None or valid(self.entries[key])):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class RouteServer:
+    """
+    A small HTTP/1.1 server that answers '/route?from=&to=&time=' with the same path, per-stop times, lines and total
+    journey time that the 'Results' window shows, as both route through a 'Batch.Router'. '/stats' reports the route
+    cache's size, hits and misses, and if a 'Profiling.Profiler' is given, the startup and per-request phase timings
+    and counters it has collected.
+
+    The network is loaded once and shared by every request. Routes are cached on (start, finish, speed profile period)
+    - a route is the same for every departure in a period in which no line changes speed, as long as it arrives before
+    the period ends. Cache misses are searched on an executor thread so the event loop keeps serving other connections.
+    """
+    def __init__(self, router, cache_size=4096, workers=4, profiler=None):
+        self.router = router
+        self.cache = LRUCache(cache_size)
+        self.executor = ThreadPoolExecutor(workers)
+        # A disabled profiler hands out no stats, so requests aren't timed unless profiling was asked for.
+        self.profiler = profiler or Profiling.Profiler(enabled=False)
+        if self.profiler.enabled:
+            self.profiler.record(router.startup)
+
+    async def route(self, start, finish, time):
+        departure = self.router.departure(time)
+        if departure is None:
+            return 400, {"error": "Invalid time parameters."}
+        stats = self.profiler.query()
+        period, left = self.router.graph.profile_period(departure)
+        key = (start, finish, period)
+        # A cached route that ran into the next period is only right for the departures it was searched for.
+        journey = self.cache.get(key, lambda cached: cached.get("total", 0) <= left)
+        if stats is not None:
+            stats.count("cache_hits", int(journey is not None))
+            stats.count("cache_misses", int(journey is None))
+        if journey is None:
+            loop = asyncio.get_running_loop()
+            journey = await loop.run_in_executor(self.executor, self.router.journey, start, finish, departure, stats)
+            if journey.get("total", 0) <= left:
+                self.cache.put(key, journey)
+        self.profiler.record(stats)
+        return (400 if "error" in journey else 200), dict({"start": start, "finish": finish, "time": time}, **journey)
+
+    async def respond(self, target):
+        # Returns the status code and JSON body for the request target (path and query string).
+        url = urlsplit(target)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == "/route":
+            if not all(key in query for key in ("from", "to", "time")):
+                return 400, {"error": "'from', 'to' and 'time' are all required."}
+            return await self.route(query["from"], query["to"], query["time"])
+        if url.path == "/stats":
+            body = {"cached": len(self.cache), "hits": self.cache.hits, "misses": self.cache.misses}
+            if self.profiler.enabled:
+                body["profile"] = self.profiler.summary()
+            return 200, body
+        return 404, {"error": "Not found."}
+
+    async def handle(self, reader, writer):
+        # Serves requests on one connection until the client closes it or asks for it to be closed.
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = (request_line.decode("latin-1").split() + ["", "", ""])[:3]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+                if method != "GET":
+                    status, body = 405, {"error": "Only GET is supported."}
+                else:
+                    # A bug in answering one request gets an error response rather than a dropped connection.
+                    try:
+                        status, body = await self.respond(target)
+                    except Exception as error:
+                        status, body = 500, {"error": "Internal server error: %s" % error}
+                keep_alive = version == "HTTP/1.1" and headers.get("connection") != "close"
+                payload = json.dumps(body).encode("utf-8")
+                writer.write(("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n"
+                              "Connection: %s\r\n\r\n" % (status, STATUS_TEXT[status], len(payload),
+                                                          "keep-alive" if keep_alive else "close")).encode("latin-1")
+                             + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves London Underground route lookups over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8080)
+    parser.add_argument("-d", "--data", default="London Underground Data.xlsx", help="The network spreadsheet.")
+    parser.add_argument("-s", "--profiles", default="Speed Profiles.csv", help="The line speed profiles table.")
+    parser.add_argument("-t", "--transfers", default="Walking Transfers.csv", help="The walking transfers table.")
+    parser.add_argument("-c", "--cache-size", type=int, default=4096, help="Routes to keep in the LRU cache.")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Executor threads for searches.")
+    parser.add_argument("--profile", action="store_true", help="Time each request's phases and report them in /stats.")
+    args = parser.parse_args(argv)
+    server = RouteServer(Batch.Router(args.data, args.profiles, args.transfers), args.cache_size, args.workers,
+                         Profiling.Profiler(args.profile))
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
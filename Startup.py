@@ -0,0 +1,87 @@
+import argparse
+import json
+import re
+import subprocess
+import sys
+
+
+# Modules that are slow to import and shouldn't be loaded just by starting the planner.
+HEAVY_MODULES = ("pandas", "numpy", "matplotlib", "openpyxl", "multiprocessing")
+
+# The time taken from a fresh interpreter to a graph that can answer queries, printed in seconds by a child process.
+# It times the planner's own 'load_routing', so whatever the planner does before it is ready is always included.
+READY_CODE = """
+import time
+started = time.perf_counter()
+import Main
+imported = time.perf_counter()
+Main.load_routing()
+loaded = time.perf_counter()
+print(imported - started, loaded - imported)
+"""
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| *(\S+)")
+
+
+def import_times(module):
+    """
+    Imports 'module' in a fresh interpreter with '-X importtime' and returns (self, cumulative) microseconds for every
+    module it loaded, keyed by name.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], capture_output=True,
+                            text=True)
+    if result.returncode:
+        raise RuntimeError("Importing %s failed:\n%s" % (module, result.stderr))
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            times[match.group(3)] = (int(match.group(1)), int(match.group(2)))
+    return times
+
+
+def measure(module, repeats):
+    # Keeps the fastest of several runs, as the slower ones mostly measure disk and scheduler noise.
+    runs = [import_times(module) for _ in range(repeats)]
+    best = min(runs, key=lambda times: times[module][1])
+    heaviest = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:5]
+    return {"module": module, "import_ms": best[module][1] / 1000,
+            "heavy_modules": [name for name in HEAVY_MODULES if name in best],
+            "slowest": [{"module": name, "self_ms": self_us / 1000} for name, (self_us, _) in heaviest]}
+
+
+def measure_ready(repeats):
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", READY_CODE], capture_output=True, text=True, check=True).stdout
+        runs.append([float(value) * 1000 for value in output.split()])
+    imported, loaded = min(runs, key=sum)
+    return {"import_ms": imported, "load_ms": loaded, "ready_ms": imported + loaded}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures cold-start import times with '-X importtime' and the time "
+                                                 "from a fresh interpreter to a graph ready for queries.")
+    parser.add_argument("-m", "--modules", default="Algorithms,Loader,Main,Batch,Server",
+                        help="Comma separated modules to import.")
+    parser.add_argument("-r", "--repeats", type=int, default=5, help="Runs per measurement; the fastest is kept.")
+    parser.add_argument("-o", "--output", help="Also write the measurements to this JSON file.")
+    args = parser.parse_args(argv)
+
+    results = {"imports": [measure(module, args.repeats) for module in args.modules.split(",")],
+               "ready": measure_ready(args.repeats)}
+    for result in results["imports"]:
+        print("%-12s %8.1f ms  heavy: %s" % (result["module"], result["import_ms"],
+                                             ", ".join(result["heavy_modules"]) or "none"))
+        for slow in result["slowest"]:
+            print("    %-40s %8.1f ms" % (slow["module"], slow["self_ms"]))
+    ready = results["ready"]
+    print("ready        %8.1f ms  (import %.1f, load_routing %.1f)" % (ready["ready_ms"], ready["import_ms"],
+                                                                      ready["load_ms"]))
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()